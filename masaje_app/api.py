@@ -1,211 +1,320 @@
-
 import frappe
-from frappe.utils import get_datetime, add_to_date, today, add_days, get_datetime
+from frappe.utils import get_datetime, add_to_date, today, add_days, get_datetime, getdate, date_diff, cint, now_datetime
 from typing import List, Dict, Any, Optional
+from masaje_app.assignment import assign_therapists
+from masaje_app.availability import find_next_openings, get_slot_availability, get_range_availability
+from masaje_app.catalog import get_branch_catalog
+from masaje_app.holds import acquire_hold, apply_holds, claim_hold, release_hold
+from masaje_app.utils import (
+    DEFAULT_SERVICE_DURATION,
+    get_branch_names,
+    get_branch_price_list,
+    get_item_prices,
+    get_service_duration,
+    get_service_durations
+)
+
+# Longest window get_availability_range will compute in one call
+MAX_AVAILABILITY_DAYS = 31
+
+# find_next_available searches this many days ahead, returning at most this many options
+NEXT_AVAILABLE_HORIZON_DAYS = 14
+MAX_NEXT_AVAILABLE = 20
+
+# Days of availability included in get_booking_bootstrap
+BOOTSTRAP_AVAILABILITY_DAYS = 7
+
+# create_booking responses are replayed for retries with the same key for this long
+BOOKING_REQUEST_TTL = 24 * 60 * 60
+# A request holding the in-flight marker is presumed dead after this many seconds
+BOOKING_REQUEST_LOCK_TIMEOUT = 60
 
 @frappe.whitelist(allow_guest=True)
 def get_branches():
     return frappe.get_all("Branch", fields=["name"], ignore_permissions=True)
 
 
-def _resolve_price_list_for_branch(branch: Optional[str]) -> str:
+@frappe.whitelist(allow_guest=True)
+def get_services(branch=None):
+    """Fetch services and their prices for a specific branch."""
+    return get_branch_catalog(branch)["services"]
+
+
+@frappe.whitelist(allow_guest=True)
+def get_service_catalog(branch=None, version=None):
     """
-    Determine which price list to use for a given branch.
+    Services and prices for a branch, with a version for client caching.
 
-    Business rules:
-    - Panglao branch uses "Panglao Prices".
-    - All other branches use "Standard Selling".
-    - If a POS Profile with a specific selling_price_list exists for a branch,
-      it can still override this default mapping.
+    Pass the version from a previous response: if the catalog has not
+    changed since, only {"version", "not_modified": True} is returned.
     """
-    if not branch:
-        return "Standard Selling"
+    catalog = get_branch_catalog(branch)
+    if version and version == catalog["version"]:
+        return {"version": catalog["version"], "not_modified": True}
+    return catalog
 
-    # Normalize for loose matching
-    normalized = branch.lower()
-    default_list = "Standard Selling"
+@frappe.whitelist(allow_guest=True)
+def get_therapists():
+    """
+    Get all active therapists (no branch filtering).
+    Therapists can work at any branch.
+    """
+    return frappe.db.sql("""
+        SELECT name, employee_name, cell_number
+        FROM `tabEmployee`
+        WHERE designation = 'Therapist' 
+        AND status = 'Active'
+        ORDER BY employee_name
+    """, as_dict=True)
 
-    # 1) Hard rule: Panglao uses Panglao Prices
-    if "panglao" in normalized:
-        default_list = "Panglao Prices"
 
-    # 2) POS Profile can still override (if configured)
-    pos_price_list = frappe.db.get_value(
-        "POS Profile",
-        {"warehouse": ["like", f"%{branch}%"]},
-        "selling_price_list",
-    )
-    return pos_price_list or default_list
+def _get_requested_duration(service_item=None) -> int:
+    """
+    Total duration (minutes) of the requested services.
+    Accepts a single item code, a list, or a JSON-encoded list.
+    """
+    import json
+    items = service_item
+    if isinstance(items, str):
+        try:
+            items = json.loads(items)
+        except:
+            items = [items] if items else []
 
+    if not items:
+        return DEFAULT_SERVICE_DURATION # Default for slot viewing
+
+    durations = get_service_durations()
+    return sum(get_service_duration(item, durations) for item in items)
 
-def _is_item_available_for_branch(item: Dict[str, Any], branch: Optional[str]) -> bool:
+
+@frappe.whitelist(allow_guest=True)
+def get_available_slots(branch, date, service_item=None):
+    """
+    Returns available time slots based on Therapist Capacity.
+    Capacity = Therapists rostered at the branch for the slot - Active Bookings
+    Note: Roaming therapists count at whichever branch their
+    Therapist Schedule puts them on that weekday.
     """
-    Filter items based on availability tags in description.
+    total_duration = _get_requested_duration(service_item)
+
+    # Occupancy per slot from one scan of the day's bookings.
+    # Bookings overlapping the requested window count against a slot,
+    # so a 90-minute booking at 13:00 also uses up the 14:00 slot.
+    slots = get_slot_availability(branch, date, total_duration)
+    apply_holds(branch, date, slots, total_duration)
 
-    Convention used in Item.description:
-    - e.g. "Sauna (Available at: Dao Branch, Panglao Branch only)"
-    - If the text "Available at:" is present, the item is ONLY available at
-      the listed branches.
-    - If no such tag is present, the item is treated as available at all branches.
+    return [slot for slot in slots if slot["capacity"] > 0]
+
+
+@frappe.whitelist(allow_guest=True)
+def get_availability_range(branch, from_date, to_date, services=None):
     """
-    if not branch:
-        # When branch is not specified, show global list
-        return True
+    Returns slot capacity for every day between from_date and to_date
+    (inclusive, at most MAX_AVAILABILITY_DAYS days), keyed by date.
+
+    Uses a single scan of Service Booking for the whole window so the
+    booking page can render a calendar without one call per day.
+    Slots with no capacity left are included with capacity 0.
+    """
+    from_date, to_date = getdate(from_date), getdate(to_date)
+
+    if to_date < from_date:
+        frappe.throw("To Date cannot be before From Date", frappe.ValidationError)
 
-    description = (item.get("description") or "").strip()
-    marker = "Available at:"
+    if date_diff(to_date, from_date) + 1 > MAX_AVAILABILITY_DAYS:
+        frappe.throw(
+            f"Availability can be requested for at most {MAX_AVAILABILITY_DAYS} days at a time",
+            frappe.ValidationError
+        )
 
-    if marker not in description:
-        # No availability restriction => available everywhere
-        return True
+    return _get_open_capacity(branch, from_date, to_date, _get_requested_duration(services))
 
-    # Extract the part after "Available at:"
-    try:
-        after_marker = description.split(marker, 1)[1]
-    except IndexError:
-        return True
 
-    # Remove closing parenthesis or trailing "only" if present
-    cleaned = after_marker.replace("only", "").replace(")", "").strip()
+def _get_open_capacity(branch, from_date, to_date, duration_minutes: int) -> Dict[str, List[Dict[str, Any]]]:
+    """Slot capacity per day after active holds, never below 0."""
+    availability = get_range_availability(branch, from_date, to_date, duration_minutes)
 
-    # Split by comma to get individual branch names
-    allowed_branches: List[str] = [b.strip() for b in cleaned.split(",") if b.strip()]
-    if not allowed_branches:
-        # If we cannot parse anything meaningful, don't hide the item
-        return True
+    for day, slots in availability.items():
+        apply_holds(branch, day, slots, duration_minutes)
+        for slot in slots:
+            slot["capacity"] = max(slot["capacity"], 0)
+
+    return availability
 
-    branch_normalized = branch.lower()
-    return any(b.lower() in branch_normalized or branch_normalized in b.lower() for b in allowed_branches)
 
 @frappe.whitelist(allow_guest=True)
-def get_services(branch=None):
-    """Fetch services and their prices for a specific branch."""
-    
-    # 1. Determine Price List for Branch using explicit business rules
-    price_list = _resolve_price_list_for_branch(branch)
-
-    # 2. Fetch Services (Non-stock Sales Items) with Price for this list
-    # We always use Item Price for the resolved list, but allow a standard_rate
-    # fallback for safety (e.g. if an item is missing from the list).
-    items: List[Dict[str, Any]] = frappe.db.sql(
-        """
-        SELECT 
-            i.name,
-            i.item_name,
-            i.description,
-            i.item_group,
-            COALESCE(ip.price_list_rate, i.standard_rate, 0) as price,
-            i.image
-        FROM `tabItem` i
-        LEFT JOIN `tabItem Price` ip
-            ON ip.item_code = i.name
-            AND ip.price_list = %s
-        WHERE i.is_sales_item = 1 
-          AND i.is_stock_item = 0
-          AND i.disabled = 0
-        ORDER BY i.item_name ASC
-    """,
-        (price_list,),
-        as_dict=True,
+def get_booking_bootstrap(branch=None, date=None, catalog_version=None):
+    """
+    Everything the booking page needs to start, in one call.
+
+    Returns the branch names and, when a branch is given, its service
+    catalog (see get_service_catalog; pass catalog_version to skip an
+    unchanged one) and slot capacity for a default-length service over
+    the first BOOTSTRAP_AVAILABILITY_DAYS days from `date`.
+    """
+    payload = {"branches": get_branch_names()}
+    if not branch:
+        return payload
+
+    start = max(getdate(date), getdate(today())) if date else getdate(today())
+
+    payload.update({
+        "catalog": get_service_catalog(branch, catalog_version),
+        "duration": DEFAULT_SERVICE_DURATION,
+        "availability": _get_open_capacity(
+            branch, start, add_days(start, BOOTSTRAP_AVAILABILITY_DAYS - 1), DEFAULT_SERVICE_DURATION
+        )
+    })
+    return payload
+
+@frappe.whitelist(allow_guest=True)
+def find_next_available(services, after=None, branches=None, limit=5):
+    """
+    Earliest open slots for the requested services across branches.
+
+    Returns up to `limit` (at most MAX_NEXT_AVAILABLE) options ordered by
+    time, each with branch, date, time and a suggested therapist. Searches
+    at most NEXT_AVAILABLE_HORIZON_DAYS days ahead and stops as soon as
+    enough options are found.
+    """
+    import json
+    if isinstance(branches, str):
+        try:
+            branches = json.loads(branches)
+        except ValueError:
+            branches = [branches]
+    if not branches:
+        branches = frappe.get_all("Branch", pluck="name", ignore_permissions=True)
+
+    limit = min(max(cint(limit), 1), MAX_NEXT_AVAILABLE)
+
+    # Never offer slots in the past
+    after = max(get_datetime(after), now_datetime()) if after else now_datetime()
+
+    openings = find_next_openings(
+        branches, after, _get_requested_duration(services), limit, NEXT_AVAILABLE_HORIZON_DAYS
     )
 
-    # 3. Apply per-branch availability filtering based on description tags.
-    #    This ensures items like Sauna are only shown for branches that are
-    #    explicitly listed in "(Available at: ...)".
-    filtered: List[Dict[str, Any]] = [
-        item for item in items if _is_item_available_for_branch(item, branch)
-    ]
+    therapist_names = dict(frappe.get_all(
+        "Employee",
+        filters={"name": ["in", list({o["therapist"] for o in openings}) or [""]]},
+        fields=["name", "employee_name"],
+        as_list=True,
+        ignore_permissions=True
+    ))
+    for opening in openings:
+        opening["therapist_name"] = therapist_names.get(opening["therapist"])
 
-    return filtered
+    return openings
 
 @frappe.whitelist(allow_guest=True)
-def get_therapists():
+def hold_slot(branch, date, time, services=None):
     """
-    Get all active therapists (no branch filtering).
-    Therapists can work at any branch.
+    Reserve one unit of capacity at a slot while the customer fills in
+    their details. Returns {"token", "expires_in"}; pass the token to
+    create_booking. Holds expire after HOLD_TTL seconds.
     """
-    return frappe.db.sql("""
-        SELECT name, employee_name, cell_number
-        FROM `tabEmployee`
-        WHERE designation = 'Therapist' 
-        AND status = 'Active'
-        ORDER BY employee_name
-    """, as_dict=True)
+    if getdate(date) < getdate(today()):
+        frappe.throw("Cannot book appointments in the past!", frappe.ValidationError)
+
+    return acquire_hold(branch, date, time, _get_requested_duration(services))
 
 
 @frappe.whitelist(allow_guest=True)
-def get_available_slots(branch, date, service_item=None):
+def release_slot_hold(token, branch, date):
+    """Give up a hold, e.g. when the customer picks another slot."""
+    release_hold(token, branch, date)
+    return {"released": True}
+
+
+@frappe.whitelist(allow_guest=True)
+def create_booking(customer_name, phone, email, branch, items, date, time, hold_token=None, idempotency_key=None):
     """
-    Returns available time slots based on Therapist Capacity.
-    Capacity = Total Active Therapists - Active Bookings
-    Note: Therapists can work at any branch (no branch filtering).
+    Create an online Service Booking (status Pending).
+
+    Clients that may retry (e.g. on a flaky connection) should send an
+    idempotency_key generated once per booking attempt: a retry with the
+    same key returns the original response instead of booking again.
+    The retry must carry the same phone, branch, date, time and services.
     """
-    date_obj = get_datetime(date)
-    day_name = date_obj.strftime("%A")
+    if not idempotency_key:
+        return _create_booking(customer_name, phone, email, branch, items, date, time, hold_token)
+
+    if len(idempotency_key) > 64:
+        frappe.throw("Invalid idempotency key", frappe.ValidationError)
+
+    cache = frappe.cache()
+    response_key = f"masaje:booking_request:{idempotency_key}"
+    fingerprint = _booking_fingerprint(phone, branch, items, date, time)
+
+    response = _get_replayed_booking(response_key, fingerprint)
+    if response:
+        return response
+
+    # Only one request per key does the work. NX makes claiming the key
+    # atomic, so two retries racing each other cannot both get through.
+    lock_key = cache.make_key(f"masaje:booking_request_lock:{idempotency_key}")
+    if not cache.set(lock_key, 1, nx=True, ex=BOOKING_REQUEST_LOCK_TIMEOUT):
+        response = _get_replayed_booking(response_key, fingerprint)
+        if response:
+            return response
+        frappe.throw("Your booking is still being processed. Please wait a moment.", frappe.ValidationError)
+
+    # A failed attempt must not block the client's next retry
+    frappe.db.after_rollback.add(lambda: cache.delete(lock_key))
+
+    response = _create_booking(customer_name, phone, email, branch, items, date, time, hold_token)
+
+    # Only remember the response once the booking is actually saved
+    frappe.db.after_commit.add(
+        lambda: cache.set_value(
+            response_key,
+            {"fingerprint": fingerprint, "response": response},
+            expires_in_sec=BOOKING_REQUEST_TTL
+        )
+    )
+    return response
+
 
-    # Determine Duration
-    # Helper logic similar to create_booking
+def _booking_fingerprint(phone, branch, items, date, time) -> str:
+    """Hash of the booking details a retry must repeat to reuse an idempotency key."""
+    import hashlib
     import json
-    items = service_item
+
     if isinstance(items, str):
         try:
             items = json.loads(items)
-        except:
-            items = [items] if items else []
-            
-    total_duration = 0
-    if not items:
-        total_duration = 60 # Default for slot viewing
-    else:
-        for item in items:
-            # Quick check for duration in name/desc or default
-            duration = 60
-            if "30" in str(item): duration = 30
-            if "90" in str(item): duration = 90
-            total_duration += duration
-
-    # 1. Get ALL active therapists (no branch/schedule filtering)
-    # Therapists can work at any branch as per business requirement
-    working_therapists = frappe.get_all("Employee",
-        filters={"designation": "Therapist", "status": "Active"},
-        fields=["name"],
-        ignore_permissions=True
-    )
-
-    if not working_therapists:
-        return []
-    
-    total_capacity = len(working_therapists)
-
-    # 2. Define Time Slots (11am to 10pm based on operating hours)
-    possible_slots = ["11:00", "12:00", "13:00", "14:00", "15:00", "16:00", 
-                      "17:00", "18:00", "19:00", "20:00", "21:00", "22:00"]
-    
-    available_slots = []
-
-    # 3. Check Capacity for each slot
-    for slot in possible_slots:
-        # Count Active Bookings at this slot + branch
-        booked_count = frappe.db.count("Service Booking", {
-            "booking_date": date,
-            "branch": branch,
-            "time_slot": slot,
-            "status": ["in", ["Pending", "Approved"]]
-        })
+        except ValueError:
+            items = [items]
+    if not isinstance(items, list):
+        items = [items]
+
+    details = [
+        str(phone or "").strip(),
+        branch,
+        str(getdate(date)),
+        str(time)[:5],
+        sorted(str(item) for item in items)
+    ]
+    return hashlib.sha256(json.dumps(details).encode()).hexdigest()
 
-        # Remaining Capacity = Total Therapists - Booked Slots
-        remaining_capacity = total_capacity - booked_count
 
-        if remaining_capacity > 0:
-            available_slots.append({
-                "time": slot,
-                "capacity": remaining_capacity
-            })
+def _get_replayed_booking(response_key, fingerprint) -> Optional[Dict[str, Any]]:
+    """
+    Response stored for an idempotency key, if any. A key reused for
+    different booking details is rejected rather than answered with
+    someone else's booking.
+    """
+    cached = frappe.cache().get_value(response_key)
+    if not cached:
+        return None
+    if cached.get("fingerprint") != fingerprint:
+        frappe.throw("This booking request key was already used for a different booking.", frappe.ValidationError)
+    return cached["response"]
 
-    return available_slots
 
-@frappe.whitelist(allow_guest=True)
-def create_booking(customer_name, phone, email, branch, items, date, time):
+def _create_booking(customer_name, phone, email, branch, items, date, time, hold_token=None):
     # Validation: Past Date
     if get_datetime(date).date() < get_datetime(today()).date():
         frappe.throw("Cannot book appointments in the past!", frappe.ValidationError)
@@ -250,32 +359,28 @@ def create_booking(customer_name, phone, email, branch, items, date, time):
     total_duration = 0
     booking_items = []
     
-    # Check price list for branch
-    price_list = frappe.get_value("POS Profile", {"warehouse": ["like", f"%{branch}%"]}, "selling_price_list") or "Standard Selling"
+    # Same price list rules as the service menu (get_services)
+    price_list = get_branch_price_list(branch)
+
+    # Names and prices of every requested item in one lookup
+    item_prices = get_item_prices(items, price_list)
+
+    # Same duration index the validate hook uses, so slot math matches what is saved
+    durations = get_service_durations()
 
     for service_item in items:
-        # Get duration and price
-        item_details = frappe.db.get_value("Item", service_item, ["item_name", "standard_rate", "description"], as_dict=True)
-        
+        item_details = item_prices.get(service_item)
         if not item_details:
              frappe.throw(f"Item {service_item} not found!", frappe.ValidationError)
 
-        # Check specific price
-        price = frappe.get_value("Item Price", {"item_code": service_item, "price_list": price_list}, "price_list_rate")
-        if not price: 
-            price = item_details.standard_rate or 0
-            
-        # Duration logic
-        duration = 60 # Default
-        if "30" in service_item: duration = 30
-        if "90" in service_item: duration = 90
+        duration = get_service_duration(service_item, durations)
         
         total_duration += duration
         
         booking_items.append({
             "service_item": service_item,
-            "service_name": item_details.item_name,
-            "price": price,
+            "service_name": item_details["item_name"],
+            "price": item_details["price"],
             "duration_minutes": duration
         })
 
@@ -297,8 +402,22 @@ def create_booking(customer_name, phone, email, branch, items, date, time):
         "items": booking_items,
         "status": "Pending"
     })
-    
+
+    # Capacity check: use the customer's hold if it still covers this slot,
+    # otherwise take one now (fails if another request got the last spot)
+    acquired = False
+    if not (hold_token and claim_hold(hold_token, branch, date, time, total_duration)):
+        hold_token = acquire_hold(branch, date, time, total_duration)["token"]
+        acquired = True
+
     booking.insert(ignore_permissions=True)
+
+    # The booking counts towards availability once committed; keep the hold
+    # until then so the spot is never free in between
+    release = lambda: release_hold(hold_token, branch, date)
+    frappe.db.after_commit.add(release)
+    if acquired:
+        frappe.db.after_rollback.add(release)
     
     # NOTE: POS Invoice is NOT created here (online bookings)
     # Workflow: 
@@ -314,6 +433,27 @@ def create_booking(customer_name, phone, email, branch, items, date, time):
     }
 
 
+@frappe.whitelist()
+def auto_assign_therapists(branch, date, dry_run=0):
+    """
+    Assign therapists to all unassigned Pending/Approved bookings of a
+    branch for a day in one pass. With dry_run the plan is returned
+    without saving anything.
+    """
+    frappe.has_permission("Service Booking", "write", throw=True)
+
+    result = assign_therapists(branch, date, dry_run=cint(dry_run))
+
+    therapist_names = dict(frappe.get_all(
+        "Employee",
+        filters={"name": ["in", list(set(result["assigned"].values())) or [""]]},
+        fields=["name", "employee_name"],
+        as_list=True
+    ))
+    result["therapist_names"] = therapist_names
+    return result
+
+
 @frappe.whitelist()
 def search_pending_bookings(txt="", branch=None):
     """
@@ -0,0 +1,145 @@
+"""
+Automatic therapist assignment for a branch's bookings on one day.
+
+Unassigned Pending/Approved bookings are placed in one pass over the day,
+earliest start first, onto rostered therapists who are free for the whole
+booking (see masaje_app.occupancy). Among the free therapists the one with
+the fewest booked minutes so far is chosen, which spreads the load.
+
+Processing by start time is the classic interval-partitioning greedy, which
+places every booking that can be placed when therapists share the same shift
+and start the day free. With staggered shifts or existing bookings a booking
+may not fit anywhere; those are reported back instead of being assigned.
+"""
+import frappe
+from frappe.utils import getdate
+from typing import List, Dict, Any, Tuple
+from masaje_app.availability import (
+    ACTIVE_BOOKING_STATUSES,
+    clear_availability_cache,
+    get_branch_roster
+)
+from masaje_app.occupancy import (
+    TherapistDay,
+    build_occupancy,
+    load_occupancy_rows,
+    minutes_into_day,
+    query_therapist_conflict
+)
+
+
+def get_unassigned_bookings(branch: str, date) -> List[Dict[str, Any]]:
+    """
+    Pending/Approved bookings of a branch on a day with no therapist yet,
+    in the (start, end) order plan_assignments places them.
+    """
+    return frappe.db.sql("""
+        SELECT name, start_datetime, end_datetime, invoice
+        FROM `tabService Booking`
+        WHERE branch = %(branch)s
+        AND booking_date = %(date)s
+        AND status IN %(statuses)s
+        AND (therapist IS NULL OR therapist = '')
+        AND start_datetime IS NOT NULL AND end_datetime IS NOT NULL
+        ORDER BY start_datetime, end_datetime
+    """, {
+        "branch": branch,
+        "date": getdate(date),
+        "statuses": ACTIVE_BOOKING_STATUSES
+    }, as_dict=True)
+
+
+def plan_assignments(day, bookings, roster, occupancy) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Assign bookings to rostered therapists without overlaps.
+
+    `occupancy` (therapist -> TherapistDay) holds existing bookings and is
+    updated in place as bookings are placed. Returns
+    ({booking name: therapist}, [names of bookings that could not be placed]).
+    """
+    load = {
+        therapist: sum(b[1] - b[0] for b in occupancy[therapist].bookings) if therapist in occupancy else 0
+        for therapist, _, _ in roster
+    }
+    shifts = [
+        (therapist, int(start.total_seconds() // 60), int(end.total_seconds() // 60))
+        for therapist, start, end in roster
+    ]
+
+    assigned: Dict[str, str] = {}
+    unplaced: List[str] = []
+
+    for booking in sorted(bookings, key=lambda b: (b["start_datetime"], b["end_datetime"])):
+        start = minutes_into_day(booking["start_datetime"], day)
+        end = minutes_into_day(booking["end_datetime"], day)
+
+        candidates = [
+            therapist for therapist, shift_start, shift_end in shifts
+            if shift_start <= start and shift_end >= end
+            and (therapist not in occupancy or occupancy[therapist].is_free(start, end))
+        ]
+        if not candidates:
+            unplaced.append(booking["name"])
+            continue
+
+        therapist = min(candidates, key=lambda t: (load[t], t))
+        occupancy.setdefault(therapist, TherapistDay()).add(start, end, booking["name"])
+        load[therapist] += end - start
+        assigned[booking["name"]] = therapist
+
+    return assigned, unplaced
+
+
+def assign_therapists(branch: str, date, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Fill in the therapist on every unassigned booking of a branch for a day
+    and write the result back in bulk. Linked draft POS Invoices get the
+    therapist too, so commission is credited when they are submitted.
+    Pairs that conflict with a booking saved in the meantime are reported
+    as unplaced instead of written.
+    """
+    day = getdate(date)
+    bookings = get_unassigned_bookings(branch, day)
+    if not bookings:
+        return {"assigned": {}, "unplaced": []}
+
+    roster = get_branch_roster(branch, day.strftime("%A"))
+
+    # Read occupancy straight from the database: this pass writes, so a
+    # cached snapshot is not good enough
+    occupancy = build_occupancy(load_occupancy_rows(day, day)[day])
+
+    assigned, unplaced = plan_assignments(day, bookings, roster, occupancy)
+
+    if not dry_run:
+        # A booking committed since the occupancy was read may overlap a
+        # planned pair - check each one against the database before writing
+        for booking in bookings:
+            therapist = assigned.get(booking.name)
+            if therapist and query_therapist_conflict(
+                therapist, booking.start_datetime, booking.end_datetime, exclude=booking.name
+            ):
+                del assigned[booking.name]
+                unplaced.append(booking.name)
+
+    if assigned and not dry_run:
+        frappe.db.bulk_update("Service Booking", {
+            name: {"therapist": therapist} for name, therapist in assigned.items()
+        })
+
+        invoices = {b.name: b.invoice for b in bookings if b.invoice and b.name in assigned}
+        draft_invoices = set(frappe.get_all(
+            "POS Invoice",
+            filters={"name": ["in", list(invoices.values()) or [""]], "docstatus": 0},
+            pluck="name"
+        ))
+        invoice_updates = {
+            invoice: {"therapist": assigned[booking]}
+            for booking, invoice in invoices.items() if invoice in draft_invoices
+        }
+        if invoice_updates:
+            frappe.db.bulk_update("POS Invoice", invoice_updates)
+
+        clear_availability_cache(branch, [day])
+
+    return {"assigned": assigned, "unplaced": unplaced}
@@ -0,0 +1,477 @@
+"""
+Slot availability engine for the booking API.
+
+A day is modelled as 288 five-minute cells. Unassigned bookings of the
+branch become +1/-1 events in a difference array whose prefix sum gives
+the demand in every cell; each rostered therapist becomes a bitmask of
+cells they cannot take (off shift or already booked, see
+masaje_app.occupancy). A slot's capacity is the number of therapists
+with no blocked cell in the slot window, minus the peak demand in it.
+
+Slot grids (15/30/60 minutes, first and last slot) are configured per
+Branch. Unassigned booking intervals are cached per (branch, date) and
+evicted by the Service Booking hooks; rosters are cached per
+(branch, weekday) and slot grids per branch until the source changes.
+"""
+import frappe
+import heapq
+from datetime import datetime, time, timedelta
+from itertools import accumulate
+from frappe.utils import add_days, date_diff, get_datetime, getdate
+from typing import List, Dict, Any, Optional, Tuple
+from masaje_app.occupancy import (
+    CELL_MINUTES,
+    CELLS_PER_DAY,
+    MINUTES_PER_DAY,
+    TherapistDay,
+    build_occupancy,
+    cell_mask,
+    clear_occupancy_cache,
+    minutes_into_day,
+    get_day_occupancy,
+    get_range_occupancy,
+    load_occupancy_rows
+)
+
+# Bookings in these statuses are holding a therapist
+ACTIVE_BOOKING_STATUSES = ("Pending", "Approved")
+
+# Cached booking intervals expire after this long even without an eviction
+AVAILABILITY_CACHE_TTL = 15 * 60
+
+ACTIVE_THERAPISTS_CACHE_KEY = "masaje:active_therapists"
+ROSTER_CACHE_PREFIX = "masaje:roster:"
+SLOT_GRID_CACHE_PREFIX = "masaje:slot_grid:"
+
+# Whole-day shift used for branches that have no roster configured
+FULL_DAY_SHIFT = (timedelta(0), timedelta(days=1))
+
+# Operating hours: 11am to 10pm, one slot per hour, unless the Branch
+# overrides them (slot_interval, opening_time, last_slot_time)
+DEFAULT_SLOT_INTERVAL = 60
+DEFAULT_OPENING_TIME = "11:00"
+DEFAULT_LAST_SLOT_TIME = "22:00"
+SLOT_INTERVALS = (15, 30, 60)
+
+DEFAULT_SLOTS = ["11:00", "12:00", "13:00", "14:00", "15:00", "16:00",
+                 "17:00", "18:00", "19:00", "20:00", "21:00", "22:00"]
+
+
+def to_timedelta(value) -> timedelta:
+    """
+    Normalize a Time value to an offset from midnight.
+    Frappe returns Time fields as timedelta, the API receives "HH:MM" strings.
+    """
+    if isinstance(value, timedelta):
+        return value
+    if isinstance(value, time):
+        return timedelta(hours=value.hour, minutes=value.minute, seconds=value.second)
+
+    parts = str(value).split(":")
+    hours = int(parts[0])
+    minutes = int(parts[1]) if len(parts) > 1 else 0
+    return timedelta(hours=hours, minutes=minutes)
+
+
+def get_branch_bookings(branch: str, from_date, to_date=None) -> List[Dict[str, Any]]:
+    """
+    Fetch the active bookings of a branch that have no therapist assigned
+    yet, between two dates (inclusive), in a single query. With no to_date
+    only from_date is loaded. Assigned bookings are tracked per therapist
+    by the occupancy bitmaps instead.
+    """
+    return frappe.db.sql("""
+        SELECT name, therapist, booking_date, time_slot, duration_minutes,
+               start_datetime, end_datetime
+        FROM `tabService Booking`
+        WHERE branch = %(branch)s
+        AND booking_date BETWEEN %(from_date)s AND %(to_date)s
+        AND status IN %(statuses)s
+        AND (therapist IS NULL OR therapist = '')
+    """, {
+        "branch": branch,
+        "from_date": getdate(from_date),
+        "to_date": getdate(to_date or from_date),
+        "statuses": ACTIVE_BOOKING_STATUSES
+    }, as_dict=True)
+
+
+def get_booking_interval(booking: Dict[str, Any], date) -> Optional[Tuple[datetime, datetime]]:
+    """
+    Return the (start, end) interval a booking occupies.
+    Falls back to booking_date + time_slot + duration for rows saved
+    before start_datetime/end_datetime were filled in by the validate hook.
+    """
+    if booking.get("start_datetime") and booking.get("end_datetime"):
+        return get_datetime(booking["start_datetime"]), get_datetime(booking["end_datetime"])
+
+    if booking.get("time_slot") is None:
+        return None
+
+    start = datetime.combine(getdate(date), time.min) + to_timedelta(booking["time_slot"])
+    return start, start + timedelta(minutes=booking.get("duration_minutes") or 60)
+
+
+def group_intervals_by_date(bookings) -> Dict[Any, List[Tuple[datetime, datetime]]]:
+    """Turn booking rows into (start, end) intervals grouped by booking_date."""
+    grouped: Dict[Any, List[Tuple[datetime, datetime]]] = {}
+    for booking in bookings:
+        day = getdate(booking["booking_date"])
+        interval = get_booking_interval(booking, day)
+        if interval:
+            grouped.setdefault(day, []).append(interval)
+    return grouped
+
+
+def _availability_cache_key(branch: str, date) -> str:
+    return f"masaje:availability:{branch}:{getdate(date)}"
+
+
+def get_day_intervals(branch: str, date) -> List[Tuple[datetime, datetime]]:
+    """Unassigned booking intervals of a branch for one day, served from cache when possible."""
+    return get_range_intervals(branch, date, date)[getdate(date)]
+
+
+def get_range_intervals(branch: str, from_date, to_date) -> Dict[Any, List[Tuple[datetime, datetime]]]:
+    """
+    Unassigned booking intervals of a branch for every day in a range,
+    keyed by date. Days missing from the cache are loaded together in one query.
+    """
+    start = getdate(from_date)
+    days = [add_days(start, offset) for offset in range(date_diff(to_date, start) + 1)]
+
+    cache = frappe.cache()
+    intervals = {}
+    missing = []
+    for day in days:
+        cached = cache.get_value(_availability_cache_key(branch, day))
+        if cached is None:
+            missing.append(day)
+        else:
+            intervals[day] = cached
+
+    if missing:
+        loaded = group_intervals_by_date(get_branch_bookings(branch, missing[0], missing[-1]))
+        for day in missing:
+            intervals[day] = loaded.get(day, [])
+            cache.set_value(_availability_cache_key(branch, day), intervals[day],
+                            expires_in_sec=AVAILABILITY_CACHE_TTL)
+
+    return intervals
+
+
+def clear_availability_cache(branch: str, dates) -> None:
+    """
+    Evict the cached availability of a branch for the given dates,
+    along with the therapist occupancy of those dates.
+    """
+    clear_occupancy_cache(dates)
+    if not branch:
+        return
+    frappe.cache().delete_value([_availability_cache_key(branch, d) for d in dates if d])
+
+
+def get_active_therapists() -> List[str]:
+    """
+    Names of all active therapists, regardless of branch.
+    Cached until an Employee changes (see events.on_employee_change).
+    """
+    return frappe.cache().get_value(
+        ACTIVE_THERAPISTS_CACHE_KEY,
+        lambda: frappe.get_all(
+            "Employee",
+            filters={"designation": "Therapist", "status": "Active"},
+            pluck="name",
+            ignore_permissions=True
+        )
+    )
+
+
+def get_branch_roster(branch: str, weekday: str) -> List[Tuple[str, timedelta, timedelta]]:
+    """
+    (therapist, shift start, shift end) of the active therapists rostered
+    at a branch on a weekday, e.g. "Monday". Shift times are offsets from
+    midnight. Off days are skipped.
+
+    Branches with no Therapist Schedule rows at all are treated as
+    unrostered: every active therapist counts as available all day.
+    """
+    key = f"{ROSTER_CACHE_PREFIX}{branch}:{weekday}"
+    roster = frappe.cache().get_value(key)
+    if roster is not None:
+        return roster
+
+    schedules = frappe.db.sql("""
+        SELECT ts.therapist, ts.start_time, ts.end_time
+        FROM `tabTherapist Schedule` ts
+        INNER JOIN `tabEmployee` e ON e.name = ts.therapist
+        WHERE ts.branch = %(branch)s
+        AND ts.day_of_week = %(weekday)s
+        AND ts.is_off = 0
+        AND e.status = 'Active'
+    """, {"branch": branch, "weekday": weekday}, as_dict=True)
+
+    if schedules:
+        roster = [
+            (s.therapist,
+             to_timedelta(s.start_time) if s.start_time is not None else FULL_DAY_SHIFT[0],
+             to_timedelta(s.end_time) if s.end_time is not None else FULL_DAY_SHIFT[1])
+            for s in schedules
+        ]
+    elif frappe.db.exists("Therapist Schedule", {"branch": branch}):
+        # Rostered branch, but nobody works here on this weekday
+        roster = []
+    else:
+        roster = [(therapist, *FULL_DAY_SHIFT) for therapist in get_active_therapists()]
+
+    frappe.cache().set_value(key, roster)
+    return roster
+
+
+def clear_roster_cache() -> None:
+    """Drop all cached rosters, e.g. after a schedule or employee change."""
+    frappe.cache().delete_keys(ROSTER_CACHE_PREFIX)
+
+
+def build_slot_grid(interval: int = DEFAULT_SLOT_INTERVAL, opening_time=DEFAULT_OPENING_TIME,
+                    last_slot_time=DEFAULT_LAST_SLOT_TIME) -> List[str]:
+    """Slot start times ("HH:MM") from opening_time to last_slot_time, every interval minutes."""
+    first = int(to_timedelta(opening_time).total_seconds() // 60)
+    last = int(to_timedelta(last_slot_time).total_seconds() // 60)
+    return [f"{m // 60:02d}:{m % 60:02d}" for m in range(first, last + 1, interval)]
+
+
+def get_branch_slot_grid(branch: str) -> List[str]:
+    """
+    Slot grid configured on the Branch, falling back to the default
+    hourly 11:00-22:00 grid for anything left blank.
+    """
+    key = f"{SLOT_GRID_CACHE_PREFIX}{branch}"
+    slots = frappe.cache().get_value(key)
+    if slots is not None:
+        return slots
+
+    config = frappe.db.get_value(
+        "Branch", branch, ["slot_interval", "opening_time", "last_slot_time"], as_dict=True
+    ) or {}
+
+    interval = int(config.get("slot_interval") or DEFAULT_SLOT_INTERVAL)
+    if interval not in SLOT_INTERVALS:
+        interval = DEFAULT_SLOT_INTERVAL
+
+    slots = build_slot_grid(
+        interval,
+        config.get("opening_time") or DEFAULT_OPENING_TIME,
+        config.get("last_slot_time") or DEFAULT_LAST_SLOT_TIME
+    )
+    frappe.cache().set_value(key, slots)
+    return slots
+
+
+def clear_slot_grid_cache(branch: Optional[str] = None) -> None:
+    """Drop the cached slot grid of one branch, or of all branches."""
+    if branch:
+        frappe.cache().delete_value(f"{SLOT_GRID_CACHE_PREFIX}{branch}")
+    else:
+        frappe.cache().delete_keys(SLOT_GRID_CACHE_PREFIX)
+
+
+def _minutes(value: timedelta) -> int:
+    return int(value.total_seconds() // 60)
+
+
+def compute_cell_demand(day, intervals) -> List[int]:
+    """
+    Number of unassigned bookings touching each five-minute cell of the
+    day: +1/-1 events in a difference array, then a prefix sum.
+    Bookings not aligned to the grid occupy every cell they touch.
+    """
+    diff = [0] * (CELLS_PER_DAY + 1)
+    for start, end in intervals:
+        first = max(minutes_into_day(start, day), 0) // CELL_MINUTES
+        last = min(-(-minutes_into_day(end, day) // CELL_MINUTES), CELLS_PER_DAY)
+        if last > first:
+            diff[first] += 1
+            diff[last] -= 1
+    return list(accumulate(diff[:CELLS_PER_DAY]))
+
+
+def build_blocked_masks(roster, occupancy: Dict[str, TherapistDay]) -> List[int]:
+    """
+    One bitmask per rostered therapist with the cells they cannot take:
+    outside their shift, or already booked (at any branch).
+    """
+    day_mask = (1 << CELLS_PER_DAY) - 1
+    masks = []
+    for therapist, shift_start, shift_end in roster:
+        # Only whole cells inside the shift are workable
+        first = -(-_minutes(shift_start) // CELL_MINUTES) * CELL_MINUTES
+        last = min(_minutes(shift_end), MINUTES_PER_DAY) // CELL_MINUTES * CELL_MINUTES
+        shift = cell_mask(first, last) if last > first else 0
+
+        therapist_day = occupancy.get(therapist)
+        busy = therapist_day.bits if therapist_day else 0
+        masks.append(busy | (day_mask & ~shift))
+    return masks
+
+
+def compute_day_availability(day, intervals, roster, occupancy=None, duration_minutes: int = 60,
+                             slots=None) -> List[Dict[str, Any]]:
+    """
+    Remaining capacity for every slot of one day, given the branch's
+    unassigned booking intervals, its roster for the weekday and the
+    therapist occupancy of the day.
+
+    A slot is occupied by any booking that overlaps the window
+    [slot, slot + duration_minutes), not only by bookings starting at it.
+    Slot windows are whole cells, so a cell-level overlap is a real one.
+    """
+    day = getdate(day)
+    slots = slots or DEFAULT_SLOTS
+
+    demand = compute_cell_demand(day, intervals)
+    blocked = build_blocked_masks(roster, occupancy or {})
+
+    availability = []
+    for slot in slots:
+        start = _minutes(to_timedelta(slot))
+        end = start + duration_minutes
+
+        if end > MINUTES_PER_DAY:
+            # Nobody works past midnight
+            availability.append({"time": slot, "capacity": 0})
+            continue
+
+        window = cell_mask(start, end)
+        free = sum(1 for mask in blocked if not mask & window)
+        booked = max(demand[start // CELL_MINUTES:-(-end // CELL_MINUTES)], default=0)
+        availability.append({"time": slot, "capacity": free - booked})
+
+    return availability
+
+
+def get_slot_availability(branch: str, date, duration_minutes: int = 60,
+                          slots=None, fresh: bool = False) -> List[Dict[str, Any]]:
+    """
+    Remaining capacity for every slot of a branch on a given day.
+    With fresh, bookings are read from the database instead of the cache,
+    for checks that guard a write.
+    """
+    day = getdate(date)
+    roster = get_branch_roster(branch, day.strftime("%A"))
+    if fresh:
+        intervals = group_intervals_by_date(get_branch_bookings(branch, day)).get(day, [])
+        occupancy = build_occupancy(load_occupancy_rows(day, day)[day])
+    else:
+        intervals = get_day_intervals(branch, day)
+        occupancy = get_day_occupancy(day)
+    slots = slots or get_branch_slot_grid(branch)
+    return compute_day_availability(day, intervals, roster, occupancy, duration_minutes, slots)
+
+
+def get_range_availability(branch: str, from_date, to_date, duration_minutes: int = 60,
+                           slots=None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Remaining capacity for every slot of every day in a date range.
+    Uncached days are loaded with one scan of the branch's bookings
+    and one scan of therapist bookings for the whole range.
+    """
+    intervals_by_date = get_range_intervals(branch, from_date, to_date)
+    occupancy_by_date = get_range_occupancy(from_date, to_date)
+    slots = slots or get_branch_slot_grid(branch)
+
+    availability = {}
+    for day, intervals in intervals_by_date.items():
+        roster = get_branch_roster(branch, day.strftime("%A"))
+        availability[str(day)] = compute_day_availability(
+            day, intervals, roster, occupancy_by_date[day], duration_minutes, slots
+        )
+
+    return availability
+
+
+def iter_branch_openings(branch: str, day, occupancy: Dict[str, TherapistDay],
+                         duration_minutes: int, after_minute: int = 0, holds=None):
+    """
+    Yield (start_minute, branch, therapist) for each bookable slot of a
+    branch on one day, earliest first, starting at after_minute. Active
+    holds of the (branch, day) (see holds.get_active_holds) take capacity
+    like unassigned bookings do.
+
+    Lazy on purpose: callers stop pulling as soon as they have enough
+    openings, so a branch is only walked as far as its first free slot.
+    The least-booked free therapist is suggested for each slot.
+    """
+    # holds.py imports this module
+    from masaje_app.holds import count_overlapping_holds
+
+    day = getdate(day)
+    roster = get_branch_roster(branch, day.strftime("%A"))
+    if not roster:
+        return
+
+    blocked = build_blocked_masks(roster, occupancy)
+    demand = None
+
+    for slot in get_branch_slot_grid(branch):
+        start = _minutes(to_timedelta(slot))
+        end = start + duration_minutes
+        if start < after_minute:
+            continue
+        if end > MINUTES_PER_DAY:
+            break
+
+        window = cell_mask(start, end)
+        free = [therapist for (therapist, _, _), mask in zip(roster, blocked) if not mask & window]
+        if not free:
+            continue
+
+        # Unassigned bookings only matter once someone is free
+        if demand is None:
+            demand = compute_cell_demand(day, get_day_intervals(branch, day))
+        booked = max(demand[start // CELL_MINUTES:-(-end // CELL_MINUTES)], default=0)
+        if holds:
+            booked += count_overlapping_holds(holds, start, end)
+        if len(free) <= booked:
+            continue
+
+        therapist = min(free, key=lambda t: len(occupancy[t].bookings) if t in occupancy else 0)
+        yield start, branch, therapist
+
+
+def find_next_openings(branches, after, duration_minutes: int = 60, limit: int = 5,
+                       horizon_days: int = 14) -> List[Dict[str, Any]]:
+    """
+    Earliest bookable (branch, date, time, therapist) options across
+    branches at or after `after`, walking forward one day at a time and
+    stopping as soon as `limit` options are found.
+    """
+    # holds.py imports this module
+    from masaje_app.holds import get_active_holds
+
+    after = get_datetime(after)
+    openings = []
+
+    for offset in range(horizon_days):
+        day = add_days(after.date(), offset)
+        after_minute = minutes_into_day(after, day) if offset == 0 else 0
+        occupancy = get_day_occupancy(day)
+
+        day_openings = heapq.merge(*[
+            iter_branch_openings(
+                branch, day, occupancy, duration_minutes, after_minute, get_active_holds(branch, day)
+            )
+            for branch in branches
+        ])
+
+        for start, branch, therapist in day_openings:
+            openings.append({
+                "branch": branch,
+                "date": str(day),
+                "time": f"{start // 60:02d}:{start % 60:02d}",
+                "therapist": therapist
+            })
+            if len(openings) >= limit:
+                return openings
+
+    return openings
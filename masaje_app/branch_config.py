@@ -0,0 +1,110 @@
+"""
+Branch configuration registry.
+
+Maps every Branch to its POS Profile, warehouse, cost center and price
+list, and POS Profiles and warehouses back to their branch. Built from
+three small queries and cached until a Branch, POS Profile or Warehouse
+changes (see events.py), so hot paths never run wildcard lookups.
+
+The matching rules are the ones the app has always used:
+
+- POS Profile: the one named "<Branch> POS", else the first whose name
+  contains the branch name.
+- Price list: the selling price list of a POS Profile whose warehouse
+  contains the branch name, else "Panglao Prices" for Panglao branches
+  and Standard Selling for the rest.
+- Branch of a POS Profile: the branch it is configured for, else the
+  branch named by its warehouse ("Bohol Main Store - MDB" -> "Bohol Main")
+  or by its own name ("Bohol Main POS" -> "Bohol Main").
+"""
+import frappe
+from typing import Dict, Any, Optional
+
+BRANCH_CONFIG_CACHE_KEY = "masaje:branch_config"
+
+STANDARD_PRICE_LIST = "Standard Selling"
+
+
+def _default_price_list(branch: str) -> str:
+    return "Panglao Prices" if "panglao" in branch.lower() else STANDARD_PRICE_LIST
+
+
+def _first_containing(profiles, field: str, branch: str):
+    needle = branch.lower()
+    return next((p for p in profiles if needle in (p.get(field) or "").lower()), None)
+
+
+def build_branch_config() -> Dict[str, Any]:
+    """Read branches, POS Profiles and warehouses and link them up."""
+    branch_fields = ["name"]
+    if frappe.get_meta("Branch").has_field("default_cost_center"):
+        branch_fields.append("default_cost_center")
+
+    branches = frappe.get_all("Branch", fields=branch_fields, order_by="name asc", ignore_permissions=True)
+    profiles = frappe.get_all(
+        "POS Profile",
+        fields=["name", "warehouse", "selling_price_list"],
+        order_by="creation asc",
+        ignore_permissions=True
+    )
+    profiles_by_name = {p.name: p for p in profiles}
+    branch_names = {b.name for b in branches}
+
+    config: Dict[str, Any] = {"branches": {}, "by_pos_profile": {}, "by_warehouse": {}}
+
+    for branch in branches:
+        profile = profiles_by_name.get(f"{branch.name} POS") or _first_containing(profiles, "name", branch.name)
+        price_profile = _first_containing(profiles, "warehouse", branch.name)
+
+        config["branches"][branch.name] = {
+            "pos_profile": profile.name if profile else None,
+            "warehouse": profile.warehouse if profile else None,
+            "cost_center": branch.get("default_cost_center"),
+            "price_list": (price_profile and price_profile.selling_price_list) or _default_price_list(branch.name)
+        }
+        if profile:
+            config["by_pos_profile"].setdefault(profile.name, branch.name)
+            if profile.warehouse:
+                config["by_warehouse"].setdefault(profile.warehouse, branch.name)
+
+    # Profiles no branch picked: fall back to their warehouse or name
+    for profile in profiles:
+        if profile.name in config["by_pos_profile"]:
+            continue
+        candidates = [profile.name.replace(" POS", "").strip()]
+        if profile.warehouse:
+            candidates.insert(0, profile.warehouse.replace(" Store", "").split(" - ")[0])
+        branch = next((c for c in candidates if c in branch_names), None)
+        if branch:
+            config["by_pos_profile"][profile.name] = branch
+            if profile.warehouse:
+                config["by_warehouse"].setdefault(profile.warehouse, branch)
+
+    return config
+
+
+def get_branch_registry() -> Dict[str, Any]:
+    return frappe.cache().get_value(BRANCH_CONFIG_CACHE_KEY, build_branch_config)
+
+
+def get_branch_config(branch: Optional[str]) -> Dict[str, Any]:
+    """{pos_profile, warehouse, cost_center, price_list} of a branch ({} if unknown)."""
+    if not branch:
+        return {}
+    return get_branch_registry()["branches"].get(branch, {})
+
+
+def get_branch_for_pos_profile(pos_profile: Optional[str]) -> Optional[str]:
+    if not pos_profile:
+        return None
+    return get_branch_registry()["by_pos_profile"].get(pos_profile)
+
+
+def get_branch_for_warehouse(warehouse: Optional[str]) -> Optional[str]:
+    if not warehouse:
+        return None
+    return get_branch_registry()["by_warehouse"].get(warehouse)
+
+
+def clear_branch_config_cache() -> None:
+    frappe.cache().delete_value(BRANCH_CONFIG_CACHE_KEY)
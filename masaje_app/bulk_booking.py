@@ -0,0 +1,251 @@
+"""
+Bulk validation and import of Service Bookings.
+
+Validating bookings one by one costs a duration lookup and a conflict
+query per booking. validate_booking_batch does the same work for a whole
+batch: durations come from one index lookup, existing bookings of the
+therapists involved are loaded in one query, and overlaps - within the
+batch and against the database - are found in one sweep over the bookings
+sorted by (therapist, start). Every conflict is reported, not just the first.
+
+Documents that pass carry `flags.masaje_batch_validated`, which makes
+events.on_service_booking_validate skip its per-document checks and
+events.on_service_booking_update its per-document cache eviction and
+invoice queueing. Conflicting documents are left unflagged, so they are
+checked again if they are saved anyway.
+
+approve_bookings approves many bookings in a background job, sharing the
+POS Profile, cost center and Sales Person lookups of their invoices.
+"""
+import json
+import frappe
+from frappe.utils import add_to_date, getdate
+from typing import List, Dict, Any
+from masaje_app.availability import clear_availability_cache
+from masaje_app.events import set_booking_times
+from masaje_app.invoicing import queue_booking_invoices
+from masaje_app.occupancy import RELEASED_BOOKING_STATUSES
+from masaje_app.utils import InvoiceContext, get_service_durations
+
+# Largest batch import_service_bookings accepts in one call
+MAX_IMPORT_BATCH = 5000
+
+
+def load_therapist_bookings(therapists, start, end, exclude) -> List[Dict[str, Any]]:
+    """Active bookings of the given therapists overlapping [start, end)."""
+    if not therapists:
+        return []
+
+    return frappe.db.sql("""
+        SELECT name, therapist, start_datetime, end_datetime
+        FROM `tabService Booking`
+        WHERE therapist IN %(therapists)s
+        AND start_datetime > %(earliest)s
+        AND start_datetime < %(end)s
+        AND end_datetime > %(start)s
+        AND status NOT IN %(released)s
+        AND name NOT IN %(exclude)s
+    """, {
+        "therapists": list(therapists),
+        "earliest": add_to_date(start, days=-1),
+        "start": start,
+        "end": end,
+        "released": RELEASED_BOOKING_STATUSES,
+        "exclude": list(exclude) or [""]
+    }, as_dict=True)
+
+
+def find_overlaps(intervals) -> List[Dict[str, Any]]:
+    """
+    One sweep over (therapist, start, end, row, name) tuples, where `row` is
+    the batch position or None for a booking already in the database.
+
+    Reports each batch booking that overlaps an earlier one of the same
+    therapist, along with the booking it runs into. Overlaps between two
+    existing bookings are not the batch's problem and are ignored.
+    """
+    conflicts: Dict[int, Dict[str, Any]] = {}
+    current_therapist = None
+    latest = None  # booking with the latest end so far for this therapist
+
+    for booking in sorted(intervals, key=lambda b: (b[0], b[1], b[2])):
+        therapist, start, end, row, name = booking
+
+        if therapist != current_therapist:
+            current_therapist, latest = therapist, booking
+            continue
+
+        if start < latest[2]:
+            # Blame the batch booking; if both are in the batch, the later one
+            offender, other = (booking, latest) if row is not None else (latest, booking)
+            if offender[3] is not None and offender[3] not in conflicts:
+                conflicts[offender[3]] = {
+                    "row": offender[3],
+                    "name": offender[4],
+                    "therapist": therapist,
+                    "start_datetime": offender[1],
+                    "end_datetime": offender[2],
+                    "conflicts_with": other[4] if other[3] is None else f"row {other[3]}",
+                    "conflicts_with_row": other[3]
+                }
+
+        if end > latest[2]:
+            latest = booking
+
+    return [conflicts[row] for row in sorted(conflicts)]
+
+
+def validate_booking_batch(docs) -> List[Dict[str, Any]]:
+    """
+    Compute times for every booking in `docs` and check them for therapist
+    overlaps as one batch. Returns the conflicts (empty if none). Only
+    documents without a conflict are flagged as validated.
+    """
+    durations = get_service_durations()
+
+    intervals = []
+    for row, doc in enumerate(docs, start=1):
+        set_booking_times(doc, durations)
+        if doc.therapist and doc.start_datetime and doc.end_datetime:
+            intervals.append((doc.therapist, doc.start_datetime, doc.end_datetime, row, doc.name))
+
+    if intervals:
+        existing = load_therapist_bookings(
+            {i[0] for i in intervals},
+            min(i[1] for i in intervals),
+            max(i[2] for i in intervals),
+            {doc.name for doc in docs if doc.name}
+        )
+        intervals.extend(
+            (b.therapist, b.start_datetime, b.end_datetime, None, b.name) for b in existing
+        )
+
+    conflicts = find_overlaps(intervals)
+
+    # Both batch bookings of a clash stay unflagged
+    conflicting_rows = {c["row"] for c in conflicts} | {c["conflicts_with_row"] for c in conflicts}
+    for row, doc in enumerate(docs, start=1):
+        if row not in conflicting_rows:
+            doc.flags.masaje_batch_validated = True
+
+    return conflicts
+
+
+@frappe.whitelist()
+def import_service_bookings(bookings):
+    """
+    Insert a list of Service Bookings (dicts of field values, including an
+    `items` table) after validating them as one batch. Nothing is inserted
+    if any booking conflicts; all conflicts are returned instead.
+    """
+    frappe.has_permission("Service Booking", "create", throw=True)
+
+    if isinstance(bookings, str):
+        bookings = json.loads(bookings)
+
+    if len(bookings) > MAX_IMPORT_BATCH:
+        frappe.throw(f"Import at most {MAX_IMPORT_BATCH} bookings at a time", frappe.ValidationError)
+
+    docs = [frappe.get_doc(dict(booking, doctype="Service Booking")) for booking in bookings]
+
+    conflicts = validate_booking_batch(docs)
+    if conflicts:
+        return {"inserted": [], "conflicts": conflicts}
+
+    for doc in docs:
+        doc.insert()
+
+    # The update hooks skipped flagged documents - evict each (branch, date) once
+    touched = {}
+    for doc in docs:
+        if doc.booking_date:
+            touched.setdefault(doc.branch, set()).add(getdate(doc.booking_date))
+
+    def evict():
+        for branch, dates in touched.items():
+            clear_availability_cache(branch, dates)
+
+    evict()
+    frappe.db.after_commit.add(evict)
+
+    queue_booking_invoices([
+        doc.name for doc in docs
+        if doc.status == "Approved" and doc.customer and not doc.invoice
+    ])
+
+    return {"inserted": [doc.name for doc in docs], "conflicts": []}
+
+
+@frappe.whitelist()
+def approve_bookings(names):
+    """
+    Approve Pending bookings in the background. Each approval creates the
+    draft POS Invoice as usual; progress and per-booking failures are sent
+    to the calling user over realtime (masaje_bulk_approval_progress /
+    masaje_bulk_approval_done).
+    """
+    frappe.has_permission("Service Booking", "write", throw=True)
+
+    if isinstance(names, str):
+        names = json.loads(names)
+    names = list(dict.fromkeys(names))
+    if not names:
+        frappe.throw("No bookings selected", frappe.ValidationError)
+
+    job = frappe.enqueue(
+        "masaje_app.bulk_booking.process_booking_approvals",
+        queue="long",
+        timeout=3600,
+        enqueue_after_commit=True,
+        names=names,
+        user=frappe.session.user
+    )
+    return {"job_id": job.id if job else None, "total": len(names)}
+
+
+def process_booking_approvals(names, user):
+    """Background job behind approve_bookings. Commits after each booking."""
+    context = InvoiceContext()
+    context.load_sales_persons(frappe.get_all(
+        "Service Booking", filters={"name": ["in", names]}, pluck="therapist"
+    ))
+
+    approved, failed = [], []
+    for progress, name in enumerate(names, start=1):
+        try:
+            doc = frappe.get_doc("Service Booking", name)
+            if doc.status != "Pending":
+                raise frappe.ValidationError(f"Booking is {doc.status}, not Pending")
+
+            doc.status = "Approved"
+            doc.flags.masaje_invoice_context = context
+            doc.save()
+            frappe.db.commit()
+
+            invoice, invoice_error = frappe.db.get_value("Service Booking", name, ["invoice", "invoice_error"])
+            if not invoice:
+                failed.append({
+                    "name": name,
+                    "error": f"Approved, but the POS Invoice could not be created: {invoice_error or 'unknown error'}"
+                })
+            else:
+                approved.append(name)
+        except Exception as e:
+            frappe.db.rollback()
+            failed.append({"name": name, "error": str(e)})
+
+        # Messages from the update hooks are meant for interactive saves
+        frappe.clear_messages()
+
+        frappe.publish_realtime(
+            "masaje_bulk_approval_progress",
+            {"progress": progress, "total": len(names), "name": name},
+            user=user
+        )
+
+    frappe.publish_realtime(
+        "masaje_bulk_approval_done",
+        {"approved": approved, "failed": failed},
+        user=user
+    )
+    return {"approved": approved, "failed": failed}
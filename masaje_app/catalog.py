@@ -0,0 +1,87 @@
+"""
+Per-branch service catalog snapshots.
+
+The priced service list a branch offers changes rarely, but is requested
+on every visit to the booking page. Each branch's list is built once and
+cached together with a version: a hash of its content. Clients send the
+version they already have and get back `not_modified` instead of the list
+when nothing changed.
+
+Snapshots are dropped when an Item, Item Price or POS Profile changes
+(see events.py). A rebuild that produces the same content keeps the same
+version, so clients only re-download after real changes.
+"""
+import hashlib
+import frappe
+from typing import List, Dict, Any, Optional
+from masaje_app.utils import (
+    get_branch_item_index,
+    get_branch_price_list,
+    get_item_prices,
+    get_service_duration,
+    get_service_durations,
+    is_item_available_for_branch
+)
+
+CATALOG_CACHE_PREFIX = "masaje:catalog:"
+
+
+def build_service_catalog(branch: Optional[str]) -> List[Dict[str, Any]]:
+    """Services (non-stock sales items) offered at a branch with their price and duration."""
+    # 1. Determine Price List for Branch using explicit business rules
+    price_list = get_branch_price_list(branch)
+
+    # 2. Fetch Services (Non-stock Sales Items)
+    items: List[Dict[str, Any]] = frappe.db.sql(
+        """
+        SELECT
+            i.name,
+            i.item_name,
+            i.description,
+            i.item_group,
+            i.image,
+            i.image_srcset
+        FROM `tabItem` i
+        WHERE i.is_sales_item = 1
+          AND i.is_stock_item = 0
+          AND i.disabled = 0
+        ORDER BY i.item_name ASC
+    """,
+        as_dict=True,
+    )
+
+    # Prices resolve like everywhere else: the branch list, then Standard
+    # Selling, then the Item's standard_rate (e.g. an item missing from the list)
+    prices = get_item_prices([item.name for item in items], price_list)
+    for item in items:
+        item.price = prices.get(item.name, {}).get("price", 0)
+
+    # 3. Apply per-branch availability (Item.available_branches) with a
+    #    set lookup in the cached branch -> items index
+    index = get_branch_item_index()
+    services = [item for item in items if is_item_available_for_branch(item.name, branch, index)]
+
+    # 4. Durations let the booking page work out slot lengths locally
+    durations = get_service_durations()
+    for item in services:
+        item.duration = get_service_duration(item.name, durations)
+
+    return services
+
+
+def _catalog_cache_key(branch: Optional[str]) -> str:
+    return f"{CATALOG_CACHE_PREFIX}{branch or ''}"
+
+
+def get_branch_catalog(branch: Optional[str]) -> Dict[str, Any]:
+    """Cached {"version", "services"} snapshot for a branch (or all branches)."""
+    def build():
+        services = build_service_catalog(branch)
+        version = hashlib.md5(frappe.as_json(services).encode()).hexdigest()[:16]
+        return {"version": version, "services": services}
+
+    return frappe.cache().get_value(_catalog_cache_key(branch), build)
+
+
+def clear_catalog_cache() -> None:
+    frappe.cache().delete_keys(CATALOG_CACHE_PREFIX)
@@ -0,0 +1,151 @@
+"""
+Append-only commission ledger with incremental balances.
+
+Submitting a POS Invoice with a therapist posts one Commission Ledger
+Entry (+1 invoice, +sales, +commission); cancelling it posts the exact
+negation of what the invoice posted. A commission recalculation
+(commissions.recalculate_commissions) posts the difference it makes to a
+submitted invoice. Entries are never edited.
+
+Commission Balance holds the running totals per (therapist, branch, day).
+Each posting adds its signed amounts to that row with a single upsert, so
+reports and payroll read a handful of balance rows instead of
+re-aggregating every POS Invoice.
+"""
+import frappe
+from frappe.utils import flt, getdate, now
+from typing import Dict, Any, List
+
+LEDGER_FIELDS = ("invoice_count", "sales_amount", "commission_amount")
+
+
+def _balance_name(therapist, branch, posting_date) -> str:
+    return f"{getdate(posting_date)}:{therapist}:{branch or ''}"
+
+
+def update_commission_balance(therapist, branch, posting_date, invoice_count, sales_amount, commission_amount) -> None:
+    """Add signed amounts to the (therapist, branch, day) balance, creating it if needed."""
+    timestamp = now()
+    frappe.db.sql("""
+        INSERT INTO `tabCommission Balance`
+            (name, creation, modified, owner, modified_by, docstatus,
+             therapist, branch, posting_date, invoice_count, sales_amount, commission_amount)
+        VALUES
+            (%(name)s, %(now)s, %(now)s, %(user)s, %(user)s, 0,
+             %(therapist)s, %(branch)s, %(posting_date)s, %(invoice_count)s, %(sales_amount)s, %(commission_amount)s)
+        ON DUPLICATE KEY UPDATE
+            invoice_count = invoice_count + VALUES(invoice_count),
+            sales_amount = sales_amount + VALUES(sales_amount),
+            commission_amount = commission_amount + VALUES(commission_amount),
+            modified = VALUES(modified)
+    """, {
+        "name": _balance_name(therapist, branch, posting_date),
+        "now": timestamp,
+        "user": frappe.session.user,
+        "therapist": therapist,
+        "branch": branch,
+        "posting_date": getdate(posting_date),
+        "invoice_count": invoice_count,
+        "sales_amount": flt(sales_amount),
+        "commission_amount": flt(commission_amount)
+    })
+
+
+def post_commission_entry(voucher, therapist, commission_rate, commission_amount, is_reversal=False,
+                          invoice_count=1, sales_amount=None) -> None:
+    """Append one ledger entry for `voucher` and roll it into the balances."""
+    if sales_amount is None:
+        sales_amount = voucher.grand_total or 0
+
+    frappe.get_doc({
+        "doctype": "Commission Ledger Entry",
+        "therapist": therapist,
+        "branch": voucher.get("branch"),
+        "posting_date": voucher.posting_date,
+        "voucher_type": voucher.doctype,
+        "voucher_no": voucher.name,
+        "is_reversal": int(is_reversal),
+        "invoice_count": invoice_count,
+        "sales_amount": sales_amount,
+        "commission_rate": commission_rate,
+        "commission_amount": commission_amount
+    }).insert(ignore_permissions=True)
+
+    update_commission_balance(
+        therapist, voucher.get("branch"), voucher.posting_date,
+        invoice_count, sales_amount, commission_amount
+    )
+
+
+def reverse_commission_entries(voucher) -> None:
+    """Post the negation of everything `voucher` has posted so far."""
+    totals = frappe.db.sql("""
+        SELECT therapist, commission_rate,
+            SUM(invoice_count) AS invoice_count,
+            SUM(sales_amount) AS sales_amount,
+            SUM(commission_amount) AS commission_amount
+        FROM `tabCommission Ledger Entry`
+        WHERE voucher_type = %s AND voucher_no = %s
+        GROUP BY therapist, commission_rate
+    """, (voucher.doctype, voucher.name), as_dict=True)
+
+    for row in totals:
+        if not any(flt(row[field]) for field in LEDGER_FIELDS):
+            continue
+        post_commission_entry(
+            voucher, row.therapist, row.commission_rate, -flt(row.commission_amount),
+            is_reversal=True, invoice_count=-int(row.invoice_count), sales_amount=-flt(row.sales_amount)
+        )
+
+
+def get_commission_balances(filters=None) -> List[Dict[str, Any]]:
+    """
+    Balances summed per therapist over the filters (from_date, to_date,
+    branch, therapist), with the therapist's name and current rate.
+    """
+    filters = frappe._dict(filters or {})
+
+    conditions = []
+    if filters.get("from_date"):
+        conditions.append("AND cb.posting_date >= %(from_date)s")
+    if filters.get("to_date"):
+        conditions.append("AND cb.posting_date <= %(to_date)s")
+    if filters.get("branch"):
+        conditions.append("AND cb.branch = %(branch)s")
+    if filters.get("therapist"):
+        conditions.append("AND cb.therapist = %(therapist)s")
+
+    return frappe.db.sql("""
+        SELECT
+            cb.therapist,
+            e.employee_name as therapist_name,
+            SUM(cb.invoice_count) as total_invoices,
+            SUM(cb.sales_amount) as total_sales,
+            e.commission_rate,
+            SUM(cb.commission_amount) as total_commission
+        FROM `tabCommission Balance` cb
+        LEFT JOIN `tabEmployee` e ON cb.therapist = e.name
+        WHERE 1 = 1
+            {conditions}
+        GROUP BY cb.therapist
+        HAVING total_invoices != 0 OR total_commission != 0
+        ORDER BY total_commission DESC
+    """.format(conditions=" ".join(conditions)), filters, as_dict=1)
+
+
+def rebuild_commission_balances() -> None:
+    """Recompute every balance from the ledger (e.g. after a backfill)."""
+    frappe.db.sql("DELETE FROM `tabCommission Balance`")
+    timestamp = now()
+    frappe.db.sql("""
+        INSERT INTO `tabCommission Balance`
+            (name, creation, modified, owner, modified_by, docstatus,
+             therapist, branch, posting_date, invoice_count, sales_amount, commission_amount)
+        SELECT
+            CONCAT(posting_date, ':', therapist, ':', IFNULL(branch, '')),
+            %(now)s, %(now)s, %(user)s, %(user)s, 0,
+            therapist, branch, posting_date,
+            SUM(invoice_count), SUM(sales_amount), SUM(commission_amount)
+        FROM `tabCommission Ledger Entry`
+        GROUP BY posting_date, therapist, branch
+    """, {"now": timestamp, "user": frappe.session.user})
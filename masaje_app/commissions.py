@@ -0,0 +1,256 @@
+"""
+Set-based commission recalculation for a period.
+
+A booking's revenue is the Standard Selling price of its service item
+(COMMISSION_FALLBACK_REVENUE if it has none), and its commission is
+COMMISSION_RATE percent of that. Only Completed and Paid bookings with a
+therapist count.
+
+Everything is computed in SQL: one query for the bookings, one aggregate
+per invoice and one per therapist, and two UPDATE ... JOINs that write
+Service Booking and POS Invoice. Draft Therapist Commission documents are
+then upserted in one pass, and the change in every submitted invoice's
+commission is posted to the commission ledger as an adjustment, so the
+ledger balances keep matching the invoices. With dry_run the same queries
+produce a diff and nothing is written.
+"""
+import frappe
+from frappe.utils import flt
+from typing import Dict, Any, List
+from masaje_app.commission_ledger import post_commission_entry
+
+COMMISSION_RATE = 10.0  # percent
+COMMISSION_FALLBACK_REVENUE = 1500.0
+COMMISSION_PRICE_LIST = "Standard Selling"
+COMMISSIONABLE_STATUSES = ("Completed", "Paid")
+
+# Shared by every query below, so the dry run sees exactly what is written.
+# An item can have several prices on the list (per UOM, per customer,
+# valid_from): one price per item is resolved first - the lowest non-zero
+# rate not tied to a customer - so every statement joins the same row.
+ITEM_PRICE_JOIN = """
+    LEFT JOIN (
+        SELECT item_code, MIN(NULLIF(price_list_rate, 0)) AS price_list_rate
+        FROM `tabItem Price`
+        WHERE price_list = %(price_list)s
+        AND IFNULL(customer, '') = ''
+        GROUP BY item_code
+    ) ip ON ip.item_code = sb.service_item
+"""
+
+BOOKINGS_WHERE = """
+    WHERE sb.booking_date BETWEEN %(start_date)s AND %(end_date)s
+    AND sb.status IN %(statuses)s
+    AND IFNULL(sb.therapist, '') != ''
+"""
+
+REVENUE = "COALESCE(NULLIF(ip.price_list_rate, 0), %(fallback)s)"
+
+# An invoice's commission covers all of its bookings
+INVOICE_COMMISSIONS = f"""
+    SELECT sb.invoice, MAX(sb.therapist) AS therapist,
+        SUM({REVENUE}) AS revenue, SUM({REVENUE}) * %(rate)s AS commission
+    FROM `tabService Booking` sb
+    {ITEM_PRICE_JOIN}
+    {BOOKINGS_WHERE}
+    AND IFNULL(sb.invoice, '') != ''
+    GROUP BY sb.invoice
+"""
+
+
+def _params(start_date, end_date) -> Dict[str, Any]:
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "statuses": COMMISSIONABLE_STATUSES,
+        "price_list": COMMISSION_PRICE_LIST,
+        "fallback": COMMISSION_FALLBACK_REVENUE,
+        "rate": COMMISSION_RATE / 100
+    }
+
+
+def get_booking_commissions(start_date, end_date) -> List[Dict[str, Any]]:
+    """Per booking: revenue and commission, next to what is stored now."""
+    return frappe.db.sql(f"""
+        SELECT sb.name, sb.therapist, sb.invoice,
+            {REVENUE} AS revenue,
+            {REVENUE} * %(rate)s AS commission,
+            sb.commission_amount AS current_commission
+        FROM `tabService Booking` sb
+        {ITEM_PRICE_JOIN}
+        {BOOKINGS_WHERE}
+    """, _params(start_date, end_date), as_dict=True)
+
+
+def get_invoice_commissions(start_date, end_date) -> List[Dict[str, Any]]:
+    """Per POS Invoice (not cancelled): revenue and commission, next to what is stored now."""
+    return frappe.db.sql(f"""
+        SELECT calc.invoice, calc.revenue, calc.commission,
+            pi.total_commission AS current_commission,
+            pi.docstatus, pi.posting_date, pi.branch,
+            COALESCE(NULLIF(pi.therapist, ''), calc.therapist) AS therapist
+        FROM ({INVOICE_COMMISSIONS}) calc
+        JOIN `tabPOS Invoice` pi ON pi.name = calc.invoice
+        WHERE pi.docstatus < 2
+    """, _params(start_date, end_date), as_dict=True)
+
+
+def get_therapist_commissions(start_date, end_date) -> Dict[str, Dict[str, Any]]:
+    """Per therapist: bookings, revenue and commission for the period."""
+    rows = frappe.db.sql(f"""
+        SELECT sb.therapist, COUNT(*) AS bookings,
+            SUM({REVENUE}) AS revenue, SUM({REVENUE}) * %(rate)s AS commission
+        FROM `tabService Booking` sb
+        {ITEM_PRICE_JOIN}
+        {BOOKINGS_WHERE}
+        GROUP BY sb.therapist
+    """, _params(start_date, end_date), as_dict=True)
+    return {row.therapist: row for row in rows}
+
+
+def write_booking_commissions(start_date, end_date) -> None:
+    """Store every booking's commission, and its invoice's, in two UPDATEs."""
+    params = _params(start_date, end_date)
+
+    frappe.db.sql(f"""
+        UPDATE `tabService Booking` sb
+        {ITEM_PRICE_JOIN}
+        SET sb.commission_amount = {REVENUE} * %(rate)s
+        {BOOKINGS_WHERE}
+    """, params)
+
+    frappe.db.sql(f"""
+        UPDATE `tabPOS Invoice` pi
+        JOIN ({INVOICE_COMMISSIONS}) calc ON calc.invoice = pi.name
+        SET pi.total_commission = calc.commission,
+            pi.amount_eligible_for_commission = calc.revenue
+        WHERE pi.docstatus < 2
+    """, params)
+
+
+def post_commission_adjustments(invoices) -> None:
+    """
+    Post the change in each submitted invoice's commission to the ledger.
+    Drafts post their commission when they are submitted.
+    """
+    for inv in invoices:
+        if inv["docstatus"] != 1:
+            continue
+        voucher = frappe._dict(
+            doctype="POS Invoice", name=inv["invoice"], branch=inv["branch"], posting_date=inv["posting_date"]
+        )
+        post_commission_entry(
+            voucher, inv["therapist"], COMMISSION_RATE, inv["new"] - inv["current"],
+            invoice_count=0, sales_amount=0
+        )
+
+
+def diff_therapist_commissions(totals, existing) -> List[Dict[str, Any]]:
+    """
+    Compare computed per-therapist totals with the Draft Therapist
+    Commissions of the period (therapist -> doc values). Each entry has an
+    action: "create", "update" or "unchanged".
+    """
+    diff = []
+    for therapist, total in sorted(totals.items()):
+        new = {
+            "total_bookings": total["bookings"],
+            "total_revenue": flt(total["revenue"]),
+            "commission_amount": flt(total["commission"])
+        }
+        current = existing.get(therapist)
+
+        if not current:
+            action = "create"
+        elif any(flt(current.get(field)) != flt(value) for field, value in new.items()):
+            action = "update"
+        else:
+            action = "unchanged"
+
+        diff.append({
+            "therapist": therapist,
+            "action": action,
+            "name": current.get("name") if current else None,
+            "current": {f: current.get(f) for f in new} if current else None,
+            "new": new
+        })
+    return diff
+
+
+def upsert_therapist_commissions(diff, start_date, end_date) -> None:
+    """Apply a diff_therapist_commissions result to Therapist Commission."""
+    for entry in diff:
+        if entry["action"] == "update":
+            frappe.db.set_value("Therapist Commission", entry["name"], entry["new"])
+        elif entry["action"] == "create":
+            frappe.get_doc(dict(
+                entry["new"],
+                doctype="Therapist Commission",
+                therapist=entry["therapist"],
+                start_date=start_date,
+                end_date=end_date,
+                commission_rate=COMMISSION_RATE,
+                status="Draft"
+            )).insert()
+
+
+def recalculate_commissions(start_date, end_date, dry_run=False) -> Dict[str, Any]:
+    """
+    Recalculate booking, invoice and therapist commissions for a period.
+    Returns what changes; with dry_run nothing is written.
+    """
+    bookings = get_booking_commissions(start_date, end_date)
+    totals = get_therapist_commissions(start_date, end_date)
+
+    # Draft documents of the period; the oldest one per therapist is kept up to date
+    existing = {}
+    for doc in frappe.get_all(
+        "Therapist Commission",
+        filters={
+            "therapist": ["in", list(totals) or [""]],
+            "start_date": start_date,
+            "end_date": end_date,
+            "docstatus": 0
+        },
+        fields=["name", "therapist", "total_bookings", "total_revenue", "commission_amount"],
+        order_by="creation asc"
+    ):
+        existing.setdefault(doc.therapist, doc)
+
+    changed_bookings = [
+        {
+            "name": b.name,
+            "therapist": b.therapist,
+            "invoice": b.invoice,
+            "current": flt(b.current_commission),
+            "new": flt(b.commission)
+        }
+        for b in bookings
+        if flt(b.current_commission) != flt(b.commission)
+    ]
+    changed_invoices = [
+        {
+            "invoice": inv.invoice,
+            "therapist": inv.therapist,
+            "branch": inv.branch,
+            "posting_date": inv.posting_date,
+            "docstatus": inv.docstatus,
+            "current": flt(inv.current_commission),
+            "new": flt(inv.commission)
+        }
+        for inv in get_invoice_commissions(start_date, end_date)
+        if flt(inv.current_commission) != flt(inv.commission)
+    ]
+    therapists = diff_therapist_commissions(totals, existing)
+
+    if not dry_run:
+        write_booking_commissions(start_date, end_date)
+        post_commission_adjustments(changed_invoices)
+        upsert_therapist_commissions(therapists, start_date, end_date)
+
+    return {
+        "dry_run": bool(dry_run),
+        "bookings": changed_bookings,
+        "invoices": changed_invoices,
+        "therapists": therapists
+    }
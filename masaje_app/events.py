@@ -1,6 +1,27 @@
 
 import frappe
-from masaje_app.utils import create_pos_invoice_for_booking
+from frappe.website.utils import clear_cache as clear_website_cache
+from masaje_app.availability import (
+    ACTIVE_THERAPISTS_CACHE_KEY,
+    clear_availability_cache,
+    clear_roster_cache,
+    clear_slot_grid_cache
+)
+from masaje_app.branch_config import clear_branch_config_cache, get_branch_for_pos_profile
+from masaje_app.catalog import clear_catalog_cache
+from masaje_app.commission_ledger import post_commission_entry, reverse_commission_entries
+from masaje_app.invoicing import create_booking_invoice, queue_booking_invoice
+from masaje_app.occupancy import query_therapist_conflict
+from masaje_app.thumbnails import queue_item_thumbnails
+from masaje_app.utils import (
+    clear_branch_item_index,
+    clear_branch_names_cache,
+    clear_item_price_cache,
+    clear_service_duration_cache,
+    create_pos_invoice_for_booking,
+    get_service_duration,
+    get_service_durations
+)
 
 
 def on_service_booking_validate(doc, method):
@@ -8,16 +29,37 @@ def on_service_booking_validate(doc, method):
     Auto-calculate duration_minutes from items table on server-side.
     Also calculates start_datetime/end_datetime and validates therapist conflicts.
     """
+    # Bulk imports validate the whole batch up front (see bulk_booking.py)
+    if doc.flags.masaje_batch_validated:
+        return
+
+    # Steps 1-2: duration and start/end from the items and time slot
+    set_booking_times(doc)
+    
+    # Step 3: Check for therapist conflicts (prevent double-booking)
+    if doc.therapist and doc.start_datetime and doc.end_datetime:
+        check_therapist_conflict(doc)
+
+    # Step 4: Cached availability for this branch/date is about to change
+    clear_booking_availability(doc)
+
+
+def set_booking_times(doc, durations=None):
+    """
+    Set duration_minutes from the items (cached Item duration index) and
+    start_datetime/end_datetime from booking_date and time_slot.
+    Pass `durations` when handling many bookings to reuse one index lookup.
+    """
     from frappe.utils import get_datetime
     from datetime import datetime, timedelta
     
-    # Step 1: Calculate total duration from items (fetch from Item doctype)
+    # Step 1: Calculate total duration from items (cached Item duration index)
     total_duration = 0
     if doc.items:
+        if durations is None:
+            durations = get_service_durations()
         for item in doc.items:
-            # Get duration from Item's custom_duration_minutes field
-            item_duration = frappe.db.get_value("Item", item.service_item, "custom_duration_minutes")
-            total_duration += (item_duration or 60)  # Default 60 if not set
+            total_duration += get_service_duration(item.service_item, durations)
     
     # Set duration if calculated from items
     if total_duration > 0:
@@ -48,10 +90,26 @@ def on_service_booking_validate(doc, method):
         # Calculate end time
         duration = doc.duration_minutes or 60
         doc.end_datetime = start_dt + timedelta(minutes=duration)
-    
-    # Step 3: Check for therapist conflicts (prevent double-booking)
-    if doc.therapist and doc.start_datetime and doc.end_datetime:
-        check_therapist_conflict(doc)
+
+
+def clear_booking_availability(doc):
+    """
+    Evict cached availability for the (branch, date) pairs a booking
+    touches - its current values and the ones before this save.
+    Evicted again after commit so a read racing the transaction
+    cannot leave stale availability in the cache.
+    """
+    keys = {(doc.branch, doc.booking_date)}
+    before = doc.get_doc_before_save()
+    if before:
+        keys.add((before.branch, before.booking_date))
+
+    def evict():
+        for branch, booking_date in keys:
+            clear_availability_cache(branch, [booking_date])
+
+    evict()
+    frappe.db.after_commit.add(evict)
 
 
 def check_therapist_conflict(doc):
@@ -59,27 +117,13 @@ def check_therapist_conflict(doc):
     Check if therapist is already booked during the booking time.
     Raises exception if conflict found.
     """
-    # Find overlapping bookings for same therapist
-    conflicts = frappe.db.sql("""
-        SELECT name, start_datetime, end_datetime
-        FROM `tabService Booking`
-        WHERE therapist = %(therapist)s
-        AND name != %(name)s
-        AND status NOT IN ('Cancelled', 'Completed')
-        AND (
-            (start_datetime <= %(start)s AND end_datetime > %(start)s)
-            OR (start_datetime < %(end)s AND end_datetime >= %(end)s)
-            OR (start_datetime >= %(start)s AND end_datetime <= %(end)s)
-        )
-    """, {
-        "therapist": doc.therapist,
-        "name": doc.name or "",
-        "start": doc.start_datetime,
-        "end": doc.end_datetime
-    }, as_dict=True)
-    
-    if conflicts:
-        conflict = conflicts[0]
+    # Overlapping bookings for same therapist. Read from the database, not
+    # the cached occupancy: this check guards a write.
+    conflict = query_therapist_conflict(
+        doc.therapist, doc.start_datetime, doc.end_datetime, exclude=doc.name
+    )
+    
+    if conflict:
         therapist_name = frappe.db.get_value("Employee", doc.therapist, "employee_name")
         frappe.throw(
             f"{therapist_name} is already booked from "
@@ -107,25 +151,32 @@ def on_service_booking_update(doc, method):
     Handle Service Booking updates.
     
     KEY TRIGGERS:
-    1. Status = 'Approved' and no invoice → Create draft POS Invoice
+    1. Status = 'Approved' and no invoice → Queue draft POS Invoice (invoicing.py)
     2. Status = 'Cancelled' and has draft invoice → Delete the draft
+
+    Bookings inserted by a bulk import (flags.masaje_batch_validated) skip
+    both the cache eviction and the invoice queueing: import_service_bookings
+    does them once for the whole batch.
     """
+    if doc.flags.masaje_batch_validated:
+        return
+
+    clear_booking_availability(doc)
+
     # Get previous status to detect change
     previous_status = doc.get_doc_before_save().status if doc.get_doc_before_save() else None
     
     # TRIGGER 1: Status changed to 'Approved' - Create draft POS Invoice
     if doc.status == "Approved" and previous_status != "Approved":
         if not doc.invoice and doc.customer:
-            invoice_name = create_pos_invoice_for_booking(doc)
-            if invoice_name:
-                frappe.msgprint(
-                    f"Draft POS Invoice <a href='/app/pos-invoice/{invoice_name}'>{invoice_name}</a> created.",
-                    alert=True
-                )
+            if doc.flags.masaje_invoice_context:
+                # Already in a background job (bulk approval) - create it now
+                # with the lookups shared across the batch
+                create_booking_invoice(doc, doc.flags.masaje_invoice_context)
             else:
+                queue_booking_invoice(doc.name)
                 frappe.msgprint(
-                    "Note: Could not create POS Invoice. Please check if POS session is open.",
-                    indicator="orange",
+                    "Draft POS Invoice is being created. Its status is shown on the booking.",
                     alert=True
                 )
     
@@ -146,6 +197,8 @@ def on_service_booking_trash(doc, method):
     When Service Booking is deleted, also delete linked draft POS Invoice.
     Submitted invoices cannot be deleted automatically.
     """
+    clear_booking_availability(doc)
+
     if doc.invoice:
         invoice_status = frappe.db.get_value("POS Invoice", doc.invoice, "docstatus")
         if invoice_status == 0:  # Draft
@@ -163,6 +216,61 @@ def on_service_booking_trash(doc, method):
             )
 
 
+def on_employee_change(doc, method):
+    """Therapist headcount feeds slot capacity - drop the cached therapists and rosters."""
+    frappe.cache().delete_value(ACTIVE_THERAPISTS_CACHE_KEY)
+    clear_roster_cache()
+
+
+def on_item_change(doc, method):
+    """Service durations, prices and branch availability are cached per Item - rebuild on next use."""
+    clear_service_duration_cache()
+    clear_item_price_cache()
+    clear_branch_item_index()
+    clear_catalog_cache()
+
+    # A new image needs thumbnails; a removed one leaves thumbnails to delete
+    if method == "on_update" and doc.has_value_changed("image") and (doc.image or doc.get("image_srcset")):
+        queue_item_thumbnails(doc.name)
+
+
+def on_item_price_change(doc, method):
+    """
+    Drop cached item prices. Every price list falls back to Standard
+    Selling, so all of them are cleared, not just doc.price_list.
+    """
+    clear_item_price_cache()
+    clear_catalog_cache()
+
+
+def on_pos_profile_change(doc, method):
+    """A POS Profile decides its branch's price list, so cached catalogs may be stale."""
+    clear_branch_config_cache()
+    clear_catalog_cache()
+
+
+def on_warehouse_change(doc, method):
+    """Warehouse names link POS Profiles to branches in the branch registry."""
+    clear_branch_config_cache()
+    clear_catalog_cache()
+
+
+def on_branch_change(doc, method):
+    """Slot interval and opening hours are configured on the Branch."""
+    clear_slot_grid_cache(doc.name)
+    clear_branch_names_cache()
+    clear_branch_config_cache()
+    clear_catalog_cache()
+
+    # The /book page lists the branches
+    clear_website_cache("book")
+
+
+def on_therapist_schedule_change(doc, method):
+    """Rosters are cached per (branch, weekday) - drop them when a schedule changes."""
+    clear_roster_cache()
+
+
 def on_pos_invoice_submit(doc, method):
 
     """
@@ -197,23 +305,28 @@ def on_pos_invoice_cancel(doc, method):
     """
     When POS Invoice is cancelled, revert linked Service Booking to Pending.
     This allows the booking to be re-processed with a new invoice.
+    Its commission is reversed in the commission ledger.
     """
+    reverse_commission_entries(doc)
+
     # Find any Service Booking linked to this invoice
     linked_booking = frappe.db.get_value(
         "Service Booking", 
         {"invoice": doc.name}, 
-        "name"
+        ["name", "branch", "booking_date"],
+        as_dict=True
     )
     
     if linked_booking:
         # Revert booking status to Pending and clear invoice link
-        frappe.db.set_value("Service Booking", linked_booking, {
+        frappe.db.set_value("Service Booking", linked_booking.name, {
             "invoice": None,
             "status": "Pending",
             "commission_amount": 0
         })
+        clear_availability_cache(linked_booking.branch, [linked_booking.booking_date])
         frappe.msgprint(
-            f"<a href='/app/service-booking/{linked_booking}'>{linked_booking}</a> reverted to Pending.",
+            f"<a href='/app/service-booking/{linked_booking.name}'>{linked_booking.name}</a> reverted to Pending.",
             alert=True
         )
 
@@ -227,17 +340,19 @@ def on_pos_invoice_trash(doc, method):
     linked_booking = frappe.db.get_value(
         "Service Booking", 
         {"invoice": doc.name}, 
-        "name"
+        ["name", "branch", "booking_date"],
+        as_dict=True
     )
     
     if linked_booking:
         # Unlink the invoice and mark as Cancelled
-        frappe.db.set_value("Service Booking", linked_booking, {
+        frappe.db.set_value("Service Booking", linked_booking.name, {
             "invoice": None,
             "status": "Cancelled"
         })
+        clear_availability_cache(linked_booking.branch, [linked_booking.booking_date])
         frappe.msgprint(
-            f"<a href='/app/service-booking/{linked_booking}'>{linked_booking}</a> marked Cancelled.",
+            f"<a href='/app/service-booking/{linked_booking.name}'>{linked_booking.name}</a> marked Cancelled.",
             alert=True
         )
 
@@ -317,21 +432,9 @@ def create_service_booking_from_invoice(pos_invoice):
         # Get branch - MUST be from POS Profile, each branch has its own POS
         branch = pos_invoice.branch
         
-        if not branch and pos_invoice.pos_profile:
-            # Method 1: Extract from warehouse name "Bohol Main Store - MDB" → "Bohol Main"
-            warehouse = frappe.db.get_value("POS Profile", pos_invoice.pos_profile, "warehouse")
-            if warehouse:
-                # Format: "Bohol Main Store - MDB" → "Bohol Main"
-                branch_name = warehouse.replace(" Store", "").split(" - ")[0]
-                if frappe.db.exists("Branch", branch_name):
-                    branch = branch_name
-            
-            # Method 2: Extract from POS Profile name "Bohol Main POS" → "Bohol Main"
-            if not branch:
-                pos_name = pos_invoice.pos_profile
-                branch_name = pos_name.replace(" POS", "").strip()
-                if frappe.db.exists("Branch", branch_name):
-                    branch = branch_name
+        if not branch:
+            # Branch of the POS Profile, from the cached branch registry
+            branch = get_branch_for_pos_profile(pos_invoice.pos_profile)
         
         # If still no branch, log error but don't use a fallback - report integrity matters
         if not branch:
@@ -375,22 +478,28 @@ def create_service_booking_from_invoice(pos_invoice):
 
 def calculate_and_store_commission(doc, therapist, linked_booking=None):
     """
-    Calculate and store commission for a POS Invoice.
+    Calculate and store commission for a POS Invoice, and post it to the
+    commission ledger.
     """
     # Get commission rate from Employee
     commission_rate = frappe.db.get_value("Employee", therapist, "commission_rate") or 0
     
-    if not commission_rate:
-        return
-    
     # Calculate commission on grand_total
     commission_amount = (doc.grand_total or 0) * (commission_rate / 100)
     
+    # Sales and invoice counts are tracked even without a rate
+    post_commission_entry(doc, therapist, commission_rate, commission_amount)
+    
+    if not commission_rate:
+        return
+    
     # Update the invoice with commission
-    doc.db_set("total_commission", commission_amount, update_modified=False)
-    doc.db_set("commission_amount", commission_amount, update_modified=False)
-    doc.db_set("commission_rate", commission_rate, update_modified=False)
-    doc.db_set("amount_eligible_for_commission", doc.grand_total, update_modified=False)
+    doc.db_set({
+        "total_commission": commission_amount,
+        "commission_amount": commission_amount,
+        "commission_rate": commission_rate,
+        "amount_eligible_for_commission": doc.grand_total
+    }, update_modified=False)
     
     # Update linked Service Booking if exists
     if linked_booking:
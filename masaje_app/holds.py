@@ -0,0 +1,138 @@
+"""
+Short-lived slot holds to stop concurrent overbooking.
+
+A hold reserves one unit of capacity for a (branch, date, time window)
+for HOLD_TTL seconds and is identified by a random token. Holds of a
+(branch, date) live in one Redis hash; checking capacity and writing a
+hold happen under a Redis lock for that (branch, date) only, so a busy
+slot at one branch never blocks bookings anywhere else. Capacity is read
+from the database under the lock, not from the availability cache, which
+a concurrent commit may be about to evict.
+
+create_booking turns a hold into a booking and drops it only after the
+booking is committed, so there is no moment where neither is counted.
+"""
+import frappe
+from frappe.utils import getdate, now_datetime
+from redis.exceptions import LockError
+from typing import List, Dict, Any, Optional
+from masaje_app.availability import get_slot_availability, to_timedelta
+
+HOLD_TTL = 10 * 60
+
+# Give up waiting for a busy (branch, date) lock after this many seconds
+HOLD_LOCK_WAIT = 5
+
+# The lock expires after this many seconds if never released - far above
+# the two queries and one HSET done under it
+HOLD_LOCK_TIMEOUT = 60
+
+
+def _holds_key(branch: str, date) -> str:
+    return f"masaje:holds:{branch}:{getdate(date)}"
+
+
+def _holds_lock(branch: str, date):
+    cache = frappe.cache()
+    return cache.lock(
+        cache.make_key(f"masaje:holds_lock:{branch}:{getdate(date)}"),
+        timeout=HOLD_LOCK_TIMEOUT,
+        blocking_timeout=HOLD_LOCK_WAIT
+    )
+
+
+def _slot_window(time, duration_minutes: int):
+    start = int(to_timedelta(time).total_seconds() // 60)
+    return start, start + duration_minutes
+
+
+def get_active_holds(branch: str, date) -> Dict[str, Dict[str, Any]]:
+    """Unexpired holds of a (branch, date), keyed by token. Expired ones are dropped."""
+    key = _holds_key(branch, date)
+    holds = frappe.cache().hgetall(key) or {}
+    now = now_datetime().timestamp()
+
+    active, expired = {}, []
+    for token, hold in holds.items():
+        token = frappe.safe_decode(token)
+        if hold["expires_at"] > now:
+            active[token] = hold
+        else:
+            expired.append(token)
+
+    if expired:
+        # One HDEL for all of them
+        frappe.cache().hdel(key, expired)
+    return active
+
+
+def count_overlapping_holds(holds, start: int, end: int, exclude: Optional[str] = None) -> int:
+    return sum(
+        1 for token, hold in holds.items()
+        if token != exclude and hold["start"] < end and hold["end"] > start
+    )
+
+
+def apply_holds(branch: str, date, slots: List[Dict[str, Any]], duration_minutes: int) -> List[Dict[str, Any]]:
+    """Reduce slot capacity by the holds overlapping each slot window."""
+    holds = get_active_holds(branch, date)
+    if holds:
+        for slot in slots:
+            start, end = _slot_window(slot["time"], duration_minutes)
+            slot["capacity"] -= count_overlapping_holds(holds, start, end)
+    return slots
+
+
+def acquire_hold(branch: str, date, time, duration_minutes: int) -> Dict[str, Any]:
+    """
+    Atomically reserve one unit of capacity for the slot window.
+    Raises ValidationError if the slot has no capacity left, or if the
+    (branch, date) lock stays busy for HOLD_LOCK_WAIT seconds.
+    """
+    start, end = _slot_window(time, duration_minutes)
+    key = _holds_key(branch, date)
+
+    lock = _holds_lock(branch, date)
+    if not lock.acquire():
+        frappe.throw("This time slot is busy, please try again", frappe.ValidationError)
+
+    try:
+        capacity = get_slot_availability(
+            branch, date, duration_minutes, [str(time)[:5]], fresh=True
+        )[0]["capacity"]
+        capacity -= count_overlapping_holds(get_active_holds(branch, date), start, end)
+        if capacity <= 0:
+            frappe.throw("Sorry, this time slot was just taken. Please choose another time.",
+                         frappe.ValidationError)
+
+        token = frappe.generate_hash(length=20)
+        frappe.cache().hset(key, token, {
+            "start": start,
+            "end": end,
+            "expires_at": now_datetime().timestamp() + HOLD_TTL
+        })
+        # Let Redis clean up the hash once every hold in it has expired
+        frappe.cache().expire(frappe.cache().make_key(key), HOLD_TTL)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # The lock expired before the release (LockNotOwnedError). Any
+            # hold is already written and stays valid - only log it.
+            frappe.log_error(f"Hold lock for {branch} {getdate(date)} expired before release", "Masaje Booking")
+
+    return {"token": token, "expires_in": HOLD_TTL}
+
+
+def claim_hold(token: str, branch: str, date, time, duration_minutes: int) -> bool:
+    """
+    Check that a hold is still active and covers the requested window.
+    The hold stays in place until release_hold is called.
+    """
+    start, end = _slot_window(time, duration_minutes)
+    hold = get_active_holds(branch, date).get(token)
+    return bool(hold and hold["start"] <= start and hold["end"] >= end)
+
+
+def release_hold(token: str, branch: str, date) -> None:
+    frappe.cache().hdel(_holds_key(branch, date), token)
@@ -13,6 +13,9 @@ app_license = "mit"
 app_include_js = "/assets/masaje_app/js/service_booking_calendar.js"
 # app_include_css = "/assets/masaje_app/css/masaje_app.css"
 
+# include js in doctype views
+doctype_list_js = {"Service Booking": "public/js/service_booking_list.js"}
+
 fixtures = [
     "Item Price",
     "Branch",
@@ -32,6 +35,42 @@ doc_events = {
         "on_trash": "masaje_app.events.on_service_booking_trash"
     },
 
+    "Item": {
+        "on_update": "masaje_app.events.on_item_change",
+        "on_trash": "masaje_app.events.on_item_change"
+    },
+
+    "Item Price": {
+        "on_update": "masaje_app.events.on_item_price_change",
+        "on_trash": "masaje_app.events.on_item_price_change"
+    },
+
+    "POS Profile": {
+        "on_update": "masaje_app.events.on_pos_profile_change",
+        "on_trash": "masaje_app.events.on_pos_profile_change"
+    },
+
+    "Warehouse": {
+        "on_update": "masaje_app.events.on_warehouse_change",
+        "on_trash": "masaje_app.events.on_warehouse_change",
+        "after_rename": "masaje_app.events.on_warehouse_change"
+    },
+
+    "Branch": {
+        "on_update": "masaje_app.events.on_branch_change",
+        "on_trash": "masaje_app.events.on_branch_change"
+    },
+
+    "Employee": {
+        "on_update": "masaje_app.events.on_employee_change",
+        "on_trash": "masaje_app.events.on_employee_change"
+    },
+
+    "Therapist Schedule": {
+        "on_update": "masaje_app.events.on_therapist_schedule_change",
+        "on_trash": "masaje_app.events.on_therapist_schedule_change"
+    },
+
     "POS Invoice": {
         "on_submit": "masaje_app.events.on_pos_invoice_submit",
         "on_cancel": "masaje_app.events.on_pos_invoice_cancel",
@@ -39,3 +78,15 @@ doc_events = {
     }
 }
 
+
+# Scheduled Tasks
+# ---------------
+
+scheduler_events = {
+    "cron": {
+        # Retry failed / lost background POS Invoice creation
+        "*/10 * * * *": [
+            "masaje_app.invoicing.retry_failed_invoices"
+        ]
+    }
+}
@@ -0,0 +1,171 @@
+"""
+Background creation of draft POS Invoices for approved bookings.
+
+Approving a booking only queues its invoice; the receptionist's save does
+not wait for it. Every Service Booking carries the state of its invoice:
+
+- invoice_status: Queued, Created or Failed
+- invoice_error: why the last attempt failed
+- invoice_attempts: attempts made so far
+
+Failed invoices are retried by the scheduler (retry_failed_invoices) until
+INVOICE_MAX_ATTEMPTS is reached; after that, or at any time, they can be
+re-driven by hand with redrive_booking_invoices.
+"""
+import frappe
+from frappe.utils import cint
+from frappe.utils.background_jobs import is_job_enqueued
+from typing import List, Optional
+from masaje_app.utils import InvoiceContext, create_pos_invoice_for_booking
+
+INVOICE_MAX_ATTEMPTS = 5
+
+INVOICE_SAVEPOINT = "masaje_booking_invoice"
+
+
+def _invoice_job_id(booking_name: str) -> str:
+    return f"masaje_invoice_{booking_name}"
+
+
+def _set_invoice_state(booking_name: str, values) -> None:
+    # set_value skips the Service Booking hooks and leaves `modified` alone
+    frappe.db.set_value("Service Booking", booking_name, values, update_modified=False)
+
+
+def queue_booking_invoice(booking_name: str) -> None:
+    """Mark a booking's invoice as Queued and create it in the background after commit."""
+    _set_invoice_state(booking_name, {"invoice_status": "Queued", "invoice_error": None})
+    frappe.enqueue(
+        "masaje_app.invoicing.process_booking_invoice",
+        queue="short",
+        job_id=_invoice_job_id(booking_name),
+        deduplicate=True,
+        enqueue_after_commit=True,
+        booking_name=booking_name
+    )
+
+
+def queue_booking_invoices(booking_names: List[str]) -> None:
+    """
+    Mark many bookings' invoices as Queued and create them in one background
+    job after commit (e.g. the Approved bookings of a bulk import).
+    """
+    if not booking_names:
+        return
+
+    frappe.db.set_value(
+        "Service Booking", {"name": ["in", booking_names]},
+        {"invoice_status": "Queued", "invoice_error": None},
+        update_modified=False
+    )
+    frappe.enqueue(
+        "masaje_app.invoicing.process_booking_invoices",
+        queue="long",
+        timeout=3600,
+        enqueue_after_commit=True,
+        booking_names=booking_names
+    )
+
+
+def create_booking_invoice(booking_doc, context=None) -> Optional[str]:
+    """
+    One attempt at creating the draft POS Invoice of a booking, recording
+    the outcome on the booking. A failed attempt is rolled back to a
+    savepoint, so it never leaves half an invoice behind.
+    """
+    attempts = cint(booking_doc.get("invoice_attempts")) + 1
+
+    frappe.db.savepoint(INVOICE_SAVEPOINT)
+    try:
+        invoice = create_pos_invoice_for_booking(booking_doc, context=context, raise_exception=True)
+    except Exception as e:
+        frappe.db.rollback(save_point=INVOICE_SAVEPOINT)
+        frappe.clear_messages()
+        _set_invoice_state(booking_doc.name, {
+            "invoice_status": "Failed",
+            "invoice_error": str(e) or repr(e),
+            "invoice_attempts": attempts
+        })
+        frappe.log_error(f"POS Invoice for {booking_doc.name} failed", "Masaje Booking")
+        return None
+
+    _set_invoice_state(booking_doc.name, {
+        "invoice_status": "Created",
+        "invoice_error": None,
+        "invoice_attempts": attempts
+    })
+    return invoice
+
+
+def process_booking_invoice(booking_name: str, context=None) -> Optional[str]:
+    """Background job: create the invoice if the booking still needs one."""
+    # Row lock: a retry queued by the scheduler waits for this attempt and
+    # then sees its invoice
+    booking = frappe.get_doc("Service Booking", booking_name, for_update=True)
+
+    if booking.invoice:
+        _set_invoice_state(booking_name, {"invoice_status": "Created", "invoice_error": None})
+        return booking.invoice
+
+    # Cancelled or reverted to Pending while queued - nothing to do
+    if booking.status != "Approved" or not booking.customer:
+        _set_invoice_state(booking_name, {"invoice_status": None})
+        return None
+
+    return create_booking_invoice(booking, context)
+
+
+def process_booking_invoices(booking_names: List[str]) -> None:
+    """Background job behind queue_booking_invoices. Commits after each booking."""
+    context = InvoiceContext()
+    context.load_sales_persons(frappe.get_all(
+        "Service Booking", filters={"name": ["in", booking_names]}, pluck="therapist"
+    ))
+
+    for name in booking_names:
+        process_booking_invoice(name, context)
+        frappe.db.commit()
+
+
+def retry_failed_invoices() -> None:
+    """
+    Scheduler: re-queue failed invoices that have attempts left, and queued
+    ones whose job was lost (e.g. a worker restart).
+    """
+    bookings = frappe.get_all(
+        "Service Booking",
+        filters={"status": "Approved", "invoice_status": ["in", ["Queued", "Failed"]]},
+        fields=["name", "invoice_status", "invoice_attempts"]
+    )
+
+    for booking in bookings:
+        if booking.invoice_status == "Failed" and cint(booking.invoice_attempts) >= INVOICE_MAX_ATTEMPTS:
+            continue
+        if not is_job_enqueued(_invoice_job_id(booking.name)):
+            queue_booking_invoice(booking.name)
+
+
+@frappe.whitelist()
+def redrive_booking_invoices(names=None) -> List[str]:
+    """
+    Queue invoice creation again for the given bookings, or for every
+    Approved booking whose invoice failed. Resets the attempt count, so
+    the scheduler retries them again too.
+    """
+    frappe.has_permission("Service Booking", "write", throw=True)
+
+    if isinstance(names, str):
+        names = frappe.parse_json(names)
+
+    filters = {"status": "Approved", "invoice": ["is", "not set"]}
+    if names:
+        filters["name"] = ["in", names]
+    else:
+        filters["invoice_status"] = "Failed"
+
+    bookings = frappe.get_all("Service Booking", filters=filters, pluck="name")
+    for name in bookings:
+        _set_invoice_state(name, {"invoice_attempts": 0})
+        queue_booking_invoice(name)
+
+    return bookings
@@ -0,0 +1,12 @@
+# Copyright (c) 2025, Aryan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class CommissionLedgerEntry(Document):
+	def validate(self):
+		# Append-only: corrections are posted as new, reversing entries
+		if not self.is_new():
+			frappe.throw("Commission Ledger Entries cannot be edited", frappe.ValidationError)
@@ -1,8 +1,8 @@
 # Copyright (c) 2025, Masaje de Bohol
 # License: MIT
 
-import frappe
 from frappe import _
+from masaje_app.commission_ledger import get_commission_balances
 
 
 def execute(filters=None):
@@ -54,42 +54,5 @@ def get_columns():
 
 
 def get_data(filters):
-    conditions = get_conditions(filters)
-    
-    data = frappe.db.sql("""
-        SELECT 
-            pi.therapist,
-            e.employee_name as therapist_name,
-            COUNT(pi.name) as total_invoices,
-            SUM(pi.grand_total) as total_sales,
-            e.commission_rate,
-            SUM(COALESCE(pi.total_commission, 0)) as total_commission
-        FROM `tabPOS Invoice` pi
-        LEFT JOIN `tabEmployee` e ON pi.therapist = e.name
-        WHERE pi.docstatus = 1
-            AND pi.therapist IS NOT NULL
-            AND pi.therapist != ''
-            {conditions}
-        GROUP BY pi.therapist
-        ORDER BY total_commission DESC
-    """.format(conditions=conditions), filters, as_dict=1)
-    
-    return data
-
-
-def get_conditions(filters):
-    conditions = []
-    
-    if filters.get("from_date"):
-        conditions.append("AND pi.posting_date >= %(from_date)s")
-    
-    if filters.get("to_date"):
-        conditions.append("AND pi.posting_date <= %(to_date)s")
-    
-    if filters.get("branch"):
-        conditions.append("AND pi.branch = %(branch)s")
-    
-    if filters.get("therapist"):
-        conditions.append("AND pi.therapist = %(therapist)s")
-    
-    return " ".join(conditions)
+    # Precomputed per-day balances from the commission ledger
+    return get_commission_balances(filters)
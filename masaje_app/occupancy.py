@@ -0,0 +1,218 @@
+"""
+Per-therapist, per-day occupancy bitmaps.
+
+Each therapist's day is a 288-bit integer, one bit per 5 minutes, built
+from the day's Service Booking rows. Free/busy checks are a single mask
+test; the exact booking intervals are kept alongside so that bookings
+which do not start on a 5-minute boundary are never reported as
+conflicting with a neighbour.
+
+The rows behind the bitmaps are cached per date and evicted together
+with the availability cache (see availability.clear_availability_cache).
+"""
+import frappe
+from datetime import datetime, time, timedelta
+from frappe.utils import add_days, add_to_date, date_diff, get_datetime, getdate
+from typing import List, Dict, Any, Optional, Tuple
+
+CELL_MINUTES = 5
+MINUTES_PER_DAY = 24 * 60
+CELLS_PER_DAY = MINUTES_PER_DAY // CELL_MINUTES
+
+# Bookings in these statuses no longer hold their therapist
+RELEASED_BOOKING_STATUSES = ("Cancelled", "Completed")
+
+OCCUPANCY_CACHE_TTL = 15 * 60
+
+
+class TherapistDay:
+    """Busy time of one therapist on one day."""
+
+    __slots__ = ("bits", "bookings")
+
+    def __init__(self):
+        self.bits = 0
+        # (start_minute, end_minute, booking name, start_datetime, end_datetime)
+        self.bookings: List[Tuple] = []
+
+    def add(self, start: int, end: int, name=None, start_datetime=None, end_datetime=None):
+        """Mark [start, end) (minutes from midnight) as busy."""
+        start, end = max(start, 0), min(end, MINUTES_PER_DAY)
+        if end <= start:
+            return
+        self.bits |= cell_mask(start, end)
+        self.bookings.append((start, end, name, start_datetime, end_datetime))
+
+    def conflict(self, start: int, end: int, exclude=None) -> Optional[Tuple]:
+        """The first booking overlapping [start, end), or None if free."""
+        if not self.bits & cell_mask(max(start, 0), min(end, MINUTES_PER_DAY)):
+            return None
+
+        # Cells are coarser than bookings - confirm against exact intervals
+        for booking in self.bookings:
+            if booking[0] < end and booking[1] > start and booking[2] != exclude:
+                return booking
+        return None
+
+    def is_free(self, start: int, end: int, exclude=None) -> bool:
+        return self.conflict(start, end, exclude) is None
+
+    def first_free_gap(self, minutes: int, after: int = 0, before: int = MINUTES_PER_DAY,
+                       step: int = CELL_MINUTES) -> Optional[int]:
+        """
+        Earliest start (minutes from midnight, aligned to step) at or after
+        `after` where the therapist is free for `minutes` and done by `before`.
+        """
+        start = -(-after // step) * step
+        while start + minutes <= before:
+            booking = self.conflict(start, start + minutes)
+            if booking is None:
+                return start
+            # Skip straight past the booking in the way
+            start = max(start + step, -(-booking[1] // step) * step)
+        return None
+
+
+def cell_mask(start: int, end: int) -> int:
+    """Bitmask of the cells touched by [start, end) minutes."""
+    first = start // CELL_MINUTES
+    last = -(-end // CELL_MINUTES)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def minutes_into_day(value: datetime, day) -> int:
+    """Minutes between midnight of `day` and `value` (may be negative or > 1440)."""
+    delta = get_datetime(value) - datetime.combine(getdate(day), time.min)
+    return int(delta.total_seconds() // 60)
+
+
+def load_occupancy_rows(from_date, to_date) -> Dict[Any, List[Tuple]]:
+    """
+    Load therapist bookings touching each day between two dates in one
+    query, keyed by day. Bookings running past midnight are included
+    (clipped) on both days.
+    """
+    start, end = getdate(from_date), getdate(to_date)
+
+    bookings = frappe.db.sql("""
+        SELECT name, therapist, start_datetime, end_datetime
+        FROM `tabService Booking`
+        WHERE therapist IS NOT NULL AND therapist != ''
+        AND booking_date BETWEEN %(from_date)s AND %(to_date)s
+        AND start_datetime IS NOT NULL AND end_datetime IS NOT NULL
+        AND status NOT IN %(released)s
+    """, {
+        "from_date": add_days(start, -1),
+        "to_date": end,
+        "released": RELEASED_BOOKING_STATUSES
+    }, as_dict=True)
+
+    rows: Dict[Any, List[Tuple]] = {add_days(start, i): [] for i in range(date_diff(end, start) + 1)}
+    for b in bookings:
+        day = getdate(b.start_datetime)
+        while day <= getdate(b.end_datetime):
+            if day in rows:
+                rows[day].append((
+                    b.therapist, b.name,
+                    minutes_into_day(b.start_datetime, day), minutes_into_day(b.end_datetime, day),
+                    b.start_datetime, b.end_datetime
+                ))
+            day = add_days(day, 1)
+
+    return rows
+
+
+def _occupancy_cache_key(date) -> str:
+    return f"masaje:occupancy:{getdate(date)}"
+
+
+def get_range_occupancy(from_date, to_date) -> Dict[Any, Dict[str, TherapistDay]]:
+    """
+    Therapist occupancy for every day in a range, keyed by day, then therapist.
+    Days missing from the cache are loaded together in one query.
+    """
+    start = getdate(from_date)
+    days = [add_days(start, offset) for offset in range(date_diff(to_date, start) + 1)]
+
+    cache = frappe.cache()
+    rows = {}
+    missing = []
+    for day in days:
+        cached = cache.get_value(_occupancy_cache_key(day))
+        if cached is None:
+            missing.append(day)
+        else:
+            rows[day] = cached
+
+    if missing:
+        loaded = load_occupancy_rows(missing[0], missing[-1])
+        for day in missing:
+            rows[day] = loaded.get(day, [])
+            cache.set_value(_occupancy_cache_key(day), rows[day], expires_in_sec=OCCUPANCY_CACHE_TTL)
+
+    return {day: build_occupancy(rows[day]) for day in days}
+
+
+def get_day_occupancy(date) -> Dict[str, TherapistDay]:
+    """Therapist occupancy for one day, keyed by therapist."""
+    return get_range_occupancy(date, date)[getdate(date)]
+
+
+def build_occupancy(rows) -> Dict[str, TherapistDay]:
+    """Build per-therapist bitmaps from cached booking rows."""
+    occupancy: Dict[str, TherapistDay] = {}
+    for therapist, name, start, end, start_datetime, end_datetime in rows:
+        occupancy.setdefault(therapist, TherapistDay()).add(start, end, name, start_datetime, end_datetime)
+    return occupancy
+
+
+def clear_occupancy_cache(dates) -> None:
+    """
+    Evict cached occupancy for the given dates. The following day is
+    evicted too, since bookings can run past midnight.
+    """
+    keys = []
+    for date in dates:
+        if date:
+            keys.append(_occupancy_cache_key(date))
+            keys.append(_occupancy_cache_key(add_days(getdate(date), 1)))
+    if keys:
+        frappe.cache().delete_value(keys)
+
+
+def query_therapist_conflict(therapist: str, start_datetime, end_datetime, exclude=None) -> Optional[Dict[str, Any]]:
+    """
+    First booking of `therapist` overlapping [start_datetime, end_datetime),
+    read straight from the database, so it is safe to use before writing
+    a booking.
+
+    The overlap test is a single range condition on start_datetime, bounded
+    below by the longest possible booking (one day - the same limit the
+    occupancy loader assumes), so it is an index range scan on
+    (therapist, start_datetime, end_datetime).
+    """
+    start, end = get_datetime(start_datetime), get_datetime(end_datetime)
+
+    conflicts = frappe.db.sql("""
+        SELECT name, start_datetime, end_datetime
+        FROM `tabService Booking`
+        WHERE therapist = %(therapist)s
+        AND start_datetime > %(earliest)s
+        AND start_datetime < %(end)s
+        AND end_datetime > %(start)s
+        AND status NOT IN %(released)s
+        AND name != %(exclude)s
+        ORDER BY start_datetime
+        LIMIT 1
+    """, {
+        "therapist": therapist,
+        "earliest": add_to_date(start, days=-1),
+        "start": start,
+        "end": end,
+        "released": RELEASED_BOOKING_STATUSES,
+        "exclude": exclude or ""
+    }, as_dict=True)
+
+    return conflicts[0] if conflicts else None
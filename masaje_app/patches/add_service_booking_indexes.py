@@ -0,0 +1,28 @@
+"""
+Composite indexes for the hot Service Booking queries.
+
+- therapist, start_datetime, end_datetime: therapist conflict check
+  (occupancy.query_therapist_conflict)
+- branch, booking_date, status, time_slot: a branch's bookings for a day
+  or range (availability.get_branch_bookings)
+- booking_date, therapist: day occupancy loading
+  (occupancy.load_occupancy_rows)
+- invoice: booking lookup from POS Invoice events
+"""
+import frappe
+
+INDEXES = {
+    "therapist_start_end_index": ["therapist", "start_datetime", "end_datetime"],
+    "branch_date_status_slot_index": ["branch", "booking_date", "status", "time_slot"],
+    "booking_date_therapist_index": ["booking_date", "therapist"],
+    "invoice_index": ["invoice"],
+}
+
+
+def execute():
+    if not frappe.db.table_exists("Service Booking"):
+        return
+
+    for index_name, fields in INDEXES.items():
+        # add_index skips indexes that already exist
+        frappe.db.add_index("Service Booking", fields, index_name)
@@ -0,0 +1,31 @@
+"""
+Seed the commission ledger from the POS Invoices submitted before it
+existed: one entry per invoice with a therapist, carrying the commission
+stored on the invoice. Balances are then rebuilt from the ledger.
+"""
+import frappe
+from frappe.utils import now
+from masaje_app.commission_ledger import rebuild_commission_balances
+
+
+def execute():
+    if frappe.db.count("Commission Ledger Entry"):
+        return
+
+    timestamp = now()
+    frappe.db.sql("""
+        INSERT INTO `tabCommission Ledger Entry`
+            (name, creation, modified, owner, modified_by, docstatus,
+             therapist, branch, posting_date, voucher_type, voucher_no, is_reversal,
+             invoice_count, sales_amount, commission_rate, commission_amount)
+        SELECT
+            CONCAT('backfill-', pi.name), %(now)s, %(now)s, 'Administrator', 'Administrator', 0,
+            pi.therapist, pi.branch, pi.posting_date, 'POS Invoice', pi.name, 0,
+            1, pi.grand_total, COALESCE(pi.commission_rate, 0), COALESCE(pi.total_commission, 0)
+        FROM `tabPOS Invoice` pi
+        WHERE pi.docstatus = 1
+            AND pi.therapist IS NOT NULL
+            AND pi.therapist != ''
+    """, {"now": timestamp})
+
+    rebuild_commission_balances()
@@ -0,0 +1,84 @@
+"""
+Move branch availability out of Item descriptions into Item.available_branches.
+
+Services used to be limited to branches with a free-text tag in the
+description, e.g. "Sauna (Available at: Dao Branch, Panglao Branch only)".
+Each tag is matched against existing Branches with the same loose rules
+the booking page used, and one Item Branch Availability row is written per
+matching branch. Items that already have rows are left alone.
+
+A tag that names no existing Branch (e.g. a branch renamed since) hid the
+item everywhere, which rows cannot express: with no rows an item is offered
+at every branch. Such items get no rows and are listed in the Error Log so
+their branches can be set by hand.
+"""
+import frappe
+from typing import List, Optional
+from masaje_app.utils import clear_branch_item_index
+
+AVAILABILITY_MARKER = "Available at:"
+
+
+def parse_available_branches(description: Optional[str], branches: List[str]) -> List[str]:
+    """Branches named in a description's "Available at:" tag, in `branches` order."""
+    description = (description or "").strip()
+    if AVAILABILITY_MARKER not in description:
+        return []
+
+    # Drop the closing parenthesis and trailing "only"
+    cleaned = description.split(AVAILABILITY_MARKER, 1)[1].replace("only", "").replace(")", "")
+    allowed = [b.strip().lower() for b in cleaned.split(",") if b.strip()]
+
+    return [
+        branch for branch in branches
+        if any(a in branch.lower() or branch.lower() in a for a in allowed)
+    ]
+
+
+def execute():
+    branches = frappe.get_all("Branch", pluck="name")
+    if not branches:
+        return
+
+    already_set = set(frappe.get_all(
+        "Item Branch Availability",
+        filters={"parenttype": "Item", "parentfield": "available_branches"},
+        pluck="parent"
+    ))
+
+    items = frappe.get_all(
+        "Item",
+        filters={"description": ["like", f"%{AVAILABILITY_MARKER}%"]},
+        fields=["name", "description"]
+    )
+
+    unmatched = []
+    for item in items:
+        if item.name in already_set:
+            continue
+
+        matched = parse_available_branches(item.description, branches)
+        if not matched:
+            unmatched.append(f"{item.name}: {item.description}")
+            continue
+
+        # Insert rows directly: the Item custom field arrives with the
+        # fixtures, which are synced after post_model_sync patches
+        for idx, branch in enumerate(matched, start=1):
+            frappe.get_doc({
+                "doctype": "Item Branch Availability",
+                "parent": item.name,
+                "parenttype": "Item",
+                "parentfield": "available_branches",
+                "idx": idx,
+                "branch": branch
+            }).db_insert()
+
+    if unmatched:
+        frappe.log_error(
+            "Items whose 'Available at:' tag names no existing Branch. They are now offered "
+            "at every branch; set Available Branches on them by hand:\n" + "\n".join(unmatched),
+            "Masaje Branch Availability"
+        )
+
+    clear_branch_item_index()
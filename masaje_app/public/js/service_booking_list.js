@@ -0,0 +1,48 @@
+frappe.listview_settings["Service Booking"] = Object.assign(frappe.listview_settings["Service Booking"] || {}, {
+    onload(listview) {
+        listview.page.add_actions_menu_item(__("Approve Selected"), () => {
+            const names = listview.get_checked_items(true);
+            if (!names.length) {
+                frappe.msgprint(__("Select the bookings to approve"));
+                return;
+            }
+
+            frappe.call({
+                method: "masaje_app.bulk_booking.approve_bookings",
+                args: { names: names },
+                freeze: true,
+                callback(r) {
+                    if (r.message) {
+                        frappe.show_alert({
+                            message: __("Approving {0} bookings in the background", [r.message.total]),
+                            indicator: "blue"
+                        });
+                    }
+                }
+            });
+        });
+
+        frappe.realtime.off("masaje_bulk_approval_progress");
+        frappe.realtime.on("masaje_bulk_approval_progress", (data) => {
+            frappe.show_progress(__("Approving Bookings"), data.progress, data.total, data.name);
+        });
+
+        frappe.realtime.off("masaje_bulk_approval_done");
+        frappe.realtime.on("masaje_bulk_approval_done", (data) => {
+            frappe.hide_progress();
+            listview.refresh();
+
+            let message = __("{0} bookings approved.", [data.approved.length]);
+            if (data.failed.length) {
+                message += "<br><br>" + __("Not approved:") + "<ul>"
+                    + data.failed.map(f => `<li><b>${f.name}</b>: ${frappe.utils.escape_html(f.error)}</li>`).join("")
+                    + "</ul>";
+            }
+            frappe.msgprint({
+                title: __("Bulk Approval"),
+                message: message,
+                indicator: data.failed.length ? "orange" : "green"
+            });
+        });
+    }
+});
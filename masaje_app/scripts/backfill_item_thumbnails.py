@@ -0,0 +1,16 @@
+"""
+Queue WebP thumbnail generation for existing service images.
+Run: bench --site erpnext.localhost execute masaje_app.scripts.backfill_item_thumbnails.run
+Pass kwargs '{"only_missing": 0}' to rebuild thumbnails for every item.
+"""
+import frappe
+from masaje_app.thumbnails import backfill_item_thumbnails
+
+
+def run(only_missing=1):
+    print("--- Queueing Item Thumbnails ---")
+
+    count = backfill_item_thumbnails(only_missing=bool(int(only_missing)))
+    frappe.db.commit()
+
+    print(f"Queued thumbnails for {count} items (processed by the 'short' worker).")
@@ -0,0 +1,147 @@
+"""
+Benchmark the therapist conflict query with and without the Service Booking indexes.
+Run: bench --site erpnext.localhost execute masaje_app.scripts.benchmark_conflict_query.run
+
+Works on a scratch copy of `tabService Booking` filled with synthetic rows
+(500k by default), so live data is never touched. For the old three-way OR
+predicate and the new single-range predicate - same projection, ordering
+and LIMIT 1, so only the predicate differs - it prints the EXPLAIN plan and
+the average time per query, first without and then with the indexes from
+patches/add_service_booking_indexes.py. The scratch table is dropped at the end.
+
+Pass kwargs '{"rows": 100000}' for a smaller run.
+
+Recorded results: benchmark_conflict_query.md.
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+import frappe
+from masaje_app.patches.add_service_booking_indexes import INDEXES
+
+SCRATCH_TABLE = "_masaje_bench_service_booking"
+THERAPISTS = 40
+BATCH_SIZE = 10000
+QUERIES = 500
+
+OLD_QUERY = f"""
+    SELECT name, start_datetime, end_datetime
+    FROM `{SCRATCH_TABLE}`
+    WHERE therapist = %(therapist)s
+    AND name != %(exclude)s
+    AND status NOT IN ('Cancelled', 'Completed')
+    AND (
+        (start_datetime <= %(start)s AND end_datetime > %(start)s)
+        OR (start_datetime < %(end)s AND end_datetime >= %(end)s)
+        OR (start_datetime >= %(start)s AND end_datetime <= %(end)s)
+    )
+    ORDER BY start_datetime
+    LIMIT 1
+"""
+
+NEW_QUERY = f"""
+    SELECT name, start_datetime, end_datetime
+    FROM `{SCRATCH_TABLE}`
+    WHERE therapist = %(therapist)s
+    AND start_datetime > %(earliest)s
+    AND start_datetime < %(end)s
+    AND end_datetime > %(start)s
+    AND status NOT IN ('Cancelled', 'Completed')
+    AND name != %(exclude)s
+    ORDER BY start_datetime
+    LIMIT 1
+"""
+
+
+def create_scratch_table():
+    frappe.db.sql_ddl(f"DROP TABLE IF EXISTS `{SCRATCH_TABLE}`")
+    frappe.db.sql_ddl(f"""
+        CREATE TABLE `{SCRATCH_TABLE}` (
+            name VARCHAR(140) PRIMARY KEY,
+            therapist VARCHAR(140),
+            branch VARCHAR(140),
+            booking_date DATE,
+            time_slot TIME,
+            status VARCHAR(140),
+            start_datetime DATETIME(6),
+            end_datetime DATETIME(6),
+            invoice VARCHAR(140)
+        )
+    """)
+
+
+def fill_scratch_table(rows):
+    """Spread bookings over ~3 years, 40 therapists and 4 branches."""
+    first_day = datetime(2023, 1, 1, 11, 0)
+    statuses = ["Completed"] * 6 + ["Approved", "Pending", "Cancelled"]
+
+    values = []
+    for i in range(rows):
+        start = first_day + timedelta(days=random.randrange(1100), minutes=30 * random.randrange(22))
+        end = start + timedelta(minutes=random.choice((30, 60, 90, 120)))
+        values.append((
+            f"SB-{i:07d}", f"EMP-{random.randrange(THERAPISTS):05d}", f"Branch {random.randrange(4)}",
+            start.date(), start.time(), random.choice(statuses), start, end, None
+        ))
+
+        if len(values) == BATCH_SIZE or i == rows - 1:
+            frappe.db.sql(
+                f"INSERT INTO `{SCRATCH_TABLE}` VALUES "
+                + ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(values)),
+                [v for row in values for v in row]
+            )
+            values = []
+
+    frappe.db.commit()
+
+
+def sample_params():
+    start = datetime(2025, 1, 1, 11, 0) + timedelta(days=random.randrange(180), minutes=30 * random.randrange(22))
+    end = start + timedelta(minutes=60)
+    return {
+        "therapist": f"EMP-{random.randrange(THERAPISTS):05d}",
+        "exclude": "",
+        "start": start,
+        "end": end,
+        "earliest": start - timedelta(days=1)
+    }
+
+
+def measure(label, query):
+    plan = frappe.db.sql(f"EXPLAIN {query}", sample_params(), as_dict=True)
+    random.seed(42)
+
+    began = time.perf_counter()
+    for _ in range(QUERIES):
+        frappe.db.sql(query, sample_params())
+    elapsed = (time.perf_counter() - began) / QUERIES * 1000
+
+    print(f"\n{label}: {elapsed:.3f} ms/query")
+    for row in plan:
+        print(f"   type={row.get('type')} key={row.get('key')} rows={row.get('rows')} extra={row.get('Extra')}")
+
+
+def run(rows=500000):
+    rows = int(rows)
+    random.seed(7)
+
+    print(f"--- Building {rows} synthetic bookings in {SCRATCH_TABLE} ---")
+    create_scratch_table()
+    try:
+        fill_scratch_table(rows)
+
+        print("\n=== Without indexes ===")
+        measure("Old OR predicate", OLD_QUERY)
+        measure("New range predicate", NEW_QUERY)
+
+        for index_name, fields in INDEXES.items():
+            frappe.db.sql_ddl(
+                f"ALTER TABLE `{SCRATCH_TABLE}` ADD INDEX `{index_name}` ({', '.join(fields)})"
+            )
+
+        print("\n=== With indexes ===")
+        measure("Old OR predicate", OLD_QUERY)
+        measure("New range predicate", NEW_QUERY)
+    finally:
+        frappe.db.sql_ddl(f"DROP TABLE IF EXISTS `{SCRATCH_TABLE}`")
@@ -0,0 +1,18 @@
+"""
+Re-queue POS Invoice creation for approved bookings whose invoice failed.
+Run: bench --site erpnext.localhost execute masaje_app.scripts.redrive_booking_invoices.run
+Pass kwargs '{"names": ["SB-0001", "SB-0002"]}' to re-drive specific bookings.
+"""
+import frappe
+from masaje_app.invoicing import redrive_booking_invoices
+
+
+def run(names=None):
+    print("--- Re-driving Booking Invoices ---")
+
+    bookings = redrive_booking_invoices(names)
+    frappe.db.commit()
+
+    for name in bookings:
+        print(f"Queued {name}")
+    print(f"Queued {len(bookings)} bookings (processed by the 'short' worker).")
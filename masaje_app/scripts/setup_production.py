@@ -144,9 +144,9 @@ def setup_item_groups():
 
 
 def setup_branch_availability_field():
-    """Skip custom field - use description to note branch availability instead."""
-    print("\n3. Skipping custom branch field (using description instead)...")
-    print("   ✓ Sauna services will have branch restriction in description")
+    """Branch availability is the Item.available_branches fixture field."""
+    print("\n3. Branch availability field comes from fixtures (Item.available_branches)...")
+    print("   ✓ Sauna services will be limited to Dao and Panglao branches")
 
 
 def setup_services():
@@ -210,9 +210,10 @@ def setup_services():
         
         # Set branch availability for Sauna services
         if sauna_only:
-            # Need to update with Table MultiSelect - for now just note in description
-            frappe.db.set_value("Item", item_code, "description", 
-                f"{english} (Available at: Dao Branch, Panglao Branch only)")
+            for branch in ("Dao Branch", "Panglao Branch"):
+                if frappe.db.exists("Branch", branch):
+                    item.append("available_branches", {"branch": branch})
+            item.save()
         
         print(f"   ✓ Created: {name} (₱{price}, {duration}min)")
     
@@ -119,6 +119,38 @@ class TestMasajeAPI(FrappeTestCase):
         expected_end = add_to_date(doc.start_datetime, minutes=90)
         self.assertEqual(get_datetime(doc.end_datetime), get_datetime(expected_end))
 
+    def test_booking_prices_from_price_list(self):
+        from masaje_app.utils import get_item_prices
+
+        prices = get_item_prices([self.item1, self.item2, "Fake-Item-123"], "Standard Selling")
+        self.assertEqual(set(prices), {self.item1, self.item2})
+        self.assertEqual(prices[self.item1]["price"], 100)
+
+        # Second call is served from the cached hash
+        self.assertEqual(get_item_prices([self.item1, self.item2], "Standard Selling"), prices)
+
+        booking = create_booking("Price Customer", "777", "price@test.com", self.branch, [self.item1, self.item2], today(), "11:00")
+        doc = frappe.get_doc("Service Booking", booking["name"])
+        self.assertEqual([item.price for item in doc.items], [100, 100])
+
+    def test_idempotency_key_tied_to_booking(self):
+        key = frappe.generate_hash(length=16)
+        first = create_booking("Retry Customer", "555", "retry@test.com", self.branch, [self.item1], today(), "12:00",
+                               idempotency_key=key)
+        frappe.db.commit()
+
+        # Same details: the original response is replayed
+        retry = create_booking("Retry Customer", "555", "retry@test.com", self.branch, [self.item1], today(), "12:00",
+                               idempotency_key=key)
+        self.assertEqual(retry["name"], first["name"])
+
+        # Same key, someone else's details: rejected
+        self.assertRaises(
+            frappe.ValidationError, create_booking,
+            "Other Customer", "556", "other@test.com", self.branch, [self.item1], today(), "12:00",
+            idempotency_key=key
+        )
+
     def test_booking_beyond_shift(self):
         # Shift ends at 18:00. 
         # Booking at 17:00 for 90 mins (end 18:30) should NOT be available.
@@ -182,7 +214,47 @@ class TestMasajeAPI(FrappeTestCase):
         self.assertEqual(len(inv.items), 1)
         self.assertEqual(inv.items[0].item_code, self.item1)
         self.assertEqual(inv.pos_profile, "Test POS Profile")
-        
+
+    def test_invoices_share_context(self):
+        from masaje_app import utils
+
+        customer = "Context Customer"
+        if not frappe.db.exists("Customer", customer):
+            frappe.get_doc({"doctype": "Customer", "customer_name": customer}).insert()
+
+        bookings = []
+        for item, slot in ((self.item1, "15:00"), (self.item2, "16:30")):
+            booking = frappe.get_doc({
+                "doctype": "Service Booking",
+                "customer": customer,
+                "branch": self.branch,
+                "booking_date": today(),
+                "time_slot": slot,
+                "status": "Pending"
+            })
+            booking.append("items", {"service_item": item, "price": 100})
+            booking.insert()
+            bookings.append(booking)
+
+        pos_profile = utils.get_pos_profile_for_branch(self.branch)
+        self.assertTrue(pos_profile, "Test branch should resolve to a POS Profile")
+
+        context = utils.InvoiceContext()
+        names = [
+            utils.create_pos_invoice_for_booking(booking, context=context, raise_exception=True)
+            for booking in bookings
+        ]
+        self.assertEqual(list(context.profile_docs), [pos_profile], "POS Profile should be loaded once")
+
+        for name, item in zip(names, (self.item1, self.item2)):
+            inv = frappe.get_doc("POS Invoice", name)
+            self.assertEqual(inv.pos_profile, pos_profile)
+            self.assertEqual(inv.customer, customer)
+            self.assertEqual(inv.items[0].item_code, item)
+            self.assertEqual(inv.net_total, 100)
+            self.assertEqual(inv.grand_total, inv.net_total + sum(t.tax_amount for t in inv.taxes))
+            self.assertTrue(inv.payments)
+
     def create_pos_profile(self):
         # Helper to create needed POS data
         # A. Cost Center
@@ -0,0 +1,90 @@
+import time
+import frappe
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from frappe.tests.utils import FrappeTestCase
+from masaje_app.assignment import assign_therapists, plan_assignments
+from masaje_app.occupancy import build_occupancy
+
+DAY = datetime(2025, 1, 11)
+
+
+def booking(name, start, minutes):
+    hour, minute = start.split(":")
+    start_dt = DAY.replace(hour=int(hour), minute=int(minute))
+    return {"name": name, "start_datetime": start_dt, "end_datetime": start_dt + timedelta(minutes=minutes)}
+
+
+def shift(therapist, start="11:00", end="23:00"):
+    return (therapist, timedelta(hours=int(start[:2])), timedelta(hours=int(end[:2])))
+
+
+class TestTherapistAssignment(FrappeTestCase):
+    def test_no_overlaps_and_load_balanced(self):
+        bookings = [
+            booking("SB-1", "11:00", 60),
+            booking("SB-2", "11:00", 90),
+            booking("SB-3", "12:00", 60),
+            booking("SB-4", "13:00", 60),
+        ]
+
+        assigned, unplaced = plan_assignments(DAY, bookings, [shift("T1"), shift("T2")], {})
+
+        self.assertEqual(unplaced, [])
+        self.assertNotEqual(assigned["SB-1"], assigned["SB-2"])
+        # T1 is free again at 12:00 and has less load than T2 (90 minutes)
+        self.assertEqual(assigned["SB-3"], assigned["SB-1"])
+        self.assertEqual(assigned["SB-4"], assigned["SB-2"])
+
+    def test_respects_existing_bookings_and_shifts(self):
+        occupancy = build_occupancy([("T1", "SB-0", 14 * 60, 15 * 60, None, None)])
+        bookings = [booking("SB-1", "14:00", 60), booking("SB-2", "19:00", 60)]
+
+        assigned, unplaced = plan_assignments(
+            DAY, bookings, [shift("T1"), shift("T2", "11:00", "18:00")], occupancy
+        )
+
+        self.assertEqual(assigned, {"SB-1": "T2", "SB-2": "T1"})
+        self.assertEqual(unplaced, [])
+
+    def test_reports_bookings_that_do_not_fit(self):
+        bookings = [booking("SB-1", "12:00", 60), booking("SB-2", "12:30", 60)]
+
+        assigned, unplaced = plan_assignments(DAY, bookings, [shift("T1")], {})
+
+        self.assertEqual(assigned, {"SB-1": "T1"})
+        self.assertEqual(unplaced, ["SB-2"])
+
+    def test_recheck_drops_pairs_booked_meanwhile(self):
+        bookings = [frappe._dict(booking(name, start, 60), invoice=None)
+                    for name, start in (("SB-1", "12:00"), ("SB-2", "14:00"))]
+
+        def conflict(therapist, start, end, exclude=None):
+            # SB-9 was saved for T1 at 14:00 after the occupancy was read
+            return {"name": "SB-9"} if exclude == "SB-2" else None
+
+        with patch("masaje_app.assignment.get_unassigned_bookings", return_value=bookings), \
+                patch("masaje_app.assignment.get_branch_roster", return_value=[shift("T1")]), \
+                patch("masaje_app.assignment.load_occupancy_rows", return_value={DAY.date(): []}), \
+                patch("masaje_app.assignment.query_therapist_conflict", side_effect=conflict), \
+                patch("masaje_app.assignment.clear_availability_cache"), \
+                patch("frappe.get_all", return_value=[]), \
+                patch("frappe.db") as db:
+            result = assign_therapists("Main", DAY.date())
+
+        self.assertEqual(result, {"assigned": {"SB-1": "T1"}, "unplaced": ["SB-2"]})
+        db.bulk_update.assert_called_once_with("Service Booking", {"SB-1": {"therapist": "T1"}})
+
+    def test_busy_saturday_is_fast(self):
+        roster = [shift(f"T{i}") for i in range(15)]
+        bookings = [
+            booking(f"SB-{i}", f"{11 + (i % 11):02d}:{(i * 15) % 60:02d}", 60 + 30 * (i % 2))
+            for i in range(60)
+        ]
+
+        started = time.perf_counter()
+        assigned, unplaced = plan_assignments(DAY, bookings, roster, {})
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(assigned) + len(unplaced), 60)
+        self.assertLess(elapsed, 0.5)
@@ -0,0 +1,158 @@
+import frappe
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from frappe.tests.utils import FrappeTestCase
+from masaje_app.api import get_availability_range
+from masaje_app.availability import (
+    DEFAULT_SLOTS,
+    FULL_DAY_SHIFT,
+    build_slot_grid,
+    compute_cell_demand,
+    compute_day_availability,
+    find_next_openings,
+    get_booking_interval
+)
+from masaje_app.occupancy import build_occupancy
+
+
+def at(hhmm):
+    hour, minute = hhmm.split(":")
+    return datetime(2025, 1, 6, int(hour), int(minute))
+
+
+def booked(intervals, slots, therapists=5):
+    """Capacity used per slot (60-minute windows) by unassigned bookings."""
+    roster = [(f"T{i}", *FULL_DAY_SHIFT) for i in range(therapists)]
+    availability = compute_day_availability("2025-01-06", intervals, roster, None, 60, slots)
+    return [therapists - s["capacity"] for s in availability]
+
+
+class TestSlotOccupancy(FrappeTestCase):
+    def test_long_booking_occupies_following_slot(self):
+        # 90-minute booking at 13:00 also uses up the 14:00 slot
+        intervals = [(at("13:00"), at("14:30"))]
+
+        self.assertEqual(booked(intervals, ["12:00", "13:00", "14:00", "15:00"]), [0, 1, 1, 0])
+
+    def test_back_to_back_bookings_do_not_overlap(self):
+        intervals = [(at("13:00"), at("14:00")), (at("14:00"), at("15:00"))]
+
+        self.assertEqual(booked(intervals, ["13:00", "13:30", "14:00"]), [1, 1, 1])
+
+    def test_peak_concurrency_within_window(self):
+        intervals = [
+            (at("13:00"), at("14:00")),
+            (at("13:30"), at("15:00")),
+            (at("13:45"), at("14:15")),
+            (at("16:00"), at("17:00")),
+        ]
+
+        self.assertEqual(booked(intervals, ["13:00", "14:00", "15:00"]), [3, 2, 0])
+
+    def test_cell_demand_prefix_sum(self):
+        demand = compute_cell_demand("2025-01-06", [(at("00:05"), at("00:15")), (at("00:10"), at("00:20"))])
+
+        self.assertEqual(demand[:5], [0, 1, 2, 1, 0])
+
+    def test_slot_grid(self):
+        self.assertEqual(build_slot_grid(), DEFAULT_SLOTS)
+        self.assertEqual(build_slot_grid(15, "11:00", "12:00"), ["11:00", "11:15", "11:30", "11:45", "12:00"])
+        self.assertEqual(build_slot_grid(30, "09:30", "10:45"), ["09:30", "10:00", "10:30"])
+
+    def test_interval_falls_back_to_time_slot(self):
+        booking = frappe._dict(time_slot="13:00", duration_minutes=90,
+                               start_datetime=None, end_datetime=None)
+
+        self.assertEqual(get_booking_interval(booking, "2025-01-06"), (at("13:00"), at("14:30")))
+
+    def test_day_availability_uses_requested_duration(self):
+        intervals = [(at("14:00"), at("15:00"))]
+
+        roster = [("T1", *FULL_DAY_SHIFT), ("T2", *FULL_DAY_SHIFT)]
+
+        slots = compute_day_availability("2025-01-06", intervals, roster, None, 90, ["12:00", "13:00", "15:00"])
+
+        # 13:00 + 90 minutes runs into the 14:00 booking
+        self.assertEqual([s["capacity"] for s in slots], [2, 1, 2])
+
+    def test_capacity_follows_roster(self):
+        # One therapist 09:00-18:00, another 13:00-22:00
+        roster = [("T1", timedelta(hours=9), timedelta(hours=18)),
+                  ("T2", timedelta(hours=13), timedelta(hours=22))]
+        intervals = [(at("14:00"), at("15:00"))]
+
+        slots = compute_day_availability("2025-01-06", intervals, roster, None, 60,
+                                          ["11:00", "14:00", "17:00", "18:00", "21:00", "22:00"])
+
+        self.assertEqual([s["capacity"] for s in slots], [1, 1, 2, 1, 1, 0])
+
+    def test_slot_past_midnight_has_no_capacity(self):
+        roster = [("T1", *FULL_DAY_SHIFT)]
+
+        slots = compute_day_availability("2025-01-06", [], roster, None, 90, ["22:00", "23:00"])
+
+        self.assertEqual([s["capacity"] for s in slots], [1, 0])
+
+    def test_busy_therapist_is_not_capacity(self):
+        # T1 has an assigned booking 13:30-14:30 (possibly at another branch)
+        roster = [("T1", *FULL_DAY_SHIFT), ("T2", *FULL_DAY_SHIFT)]
+        occupancy = build_occupancy([("T1", "SB-1", 13 * 60 + 30, 14 * 60 + 30, None, None)])
+
+        slots = compute_day_availability("2025-01-06", [], roster, occupancy, 60, ["12:00", "13:00", "14:00", "15:00"])
+
+        self.assertEqual([s["capacity"] for s in slots], [2, 1, 1, 2])
+
+    def test_availability_range_is_bounded(self):
+        with self.assertRaises(frappe.ValidationError):
+            get_availability_range("Test Branch", "2025-01-01", "2025-03-01")
+
+        with self.assertRaises(frappe.ValidationError):
+            get_availability_range("Test Branch", "2025-01-10", "2025-01-01")
+
+
+class TestNextAvailable(FrappeTestCase):
+    def setUp(self):
+        rosters = {
+            "Main": [("T1", timedelta(hours=11), timedelta(hours=18))],
+            "Downtown": [("T2", timedelta(hours=15), timedelta(hours=22))],
+        }
+        # T1 is booked 11:00-13:30 on the first day
+        occupancy = build_occupancy([("T1", "SB-1", 11 * 60, 13 * 60 + 30, None, None)])
+
+        for target, value in (
+            ("get_branch_roster", lambda branch, weekday: rosters[branch]),
+            ("get_branch_slot_grid", lambda branch: DEFAULT_SLOTS),
+            ("get_day_occupancy", lambda day: occupancy if str(day) == "2025-01-06" else {}),
+            ("get_day_intervals", lambda branch, day: []),
+        ):
+            patcher = patch(f"masaje_app.availability.{target}", side_effect=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.holds = {}
+        patcher = patch(
+            "masaje_app.holds.get_active_holds",
+            side_effect=lambda branch, day: self.holds.get((branch, str(day)), {})
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_earliest_options_across_branches(self):
+        openings = find_next_openings(["Main", "Downtown"], at("10:00"), 60, limit=3)
+
+        self.assertEqual(
+            [(o["branch"], o["time"], o["therapist"]) for o in openings],
+            [("Main", "14:00", "T1"), ("Downtown", "15:00", "T2"), ("Main", "15:00", "T1")]
+        )
+
+    def test_rolls_over_to_next_day(self):
+        openings = find_next_openings(["Main"], at("17:30"), 60, limit=1)
+
+        self.assertEqual((openings[0]["date"], openings[0]["time"]), ("2025-01-07", "11:00"))
+
+    def test_held_slot_is_not_offered(self):
+        # A customer holds Main 14:00-15:00, T1's only free hour before 15:00
+        self.holds[("Main", "2025-01-06")] = {"HOLD-1": {"start": 14 * 60, "end": 15 * 60, "expires_at": 0}}
+        openings = find_next_openings(["Main"], at("10:00"), 60, limit=2)
+
+        self.assertEqual([o["time"] for o in openings], ["15:00", "16:00"])
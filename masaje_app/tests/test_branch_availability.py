@@ -0,0 +1,44 @@
+import frappe
+from unittest.mock import patch
+from frappe.tests.utils import FrappeTestCase
+from masaje_app.patches.backfill_item_branch_availability import execute, parse_available_branches
+from masaje_app.utils import is_item_available_for_branch
+
+BRANCHES = ["Bohol Main", "Dao Branch", "Panglao Branch"]
+
+
+class TestBranchAvailability(FrappeTestCase):
+    def test_parse_description_tag(self):
+        self.assertEqual(
+            parse_available_branches("Sauna (Available at: Dao Branch, Panglao Branch only)", BRANCHES),
+            ["Dao Branch", "Panglao Branch"]
+        )
+        self.assertEqual(parse_available_branches("Relaxing massage", BRANCHES), [])
+        self.assertEqual(parse_available_branches(None, BRANCHES), [])
+
+    def test_index_lookup(self):
+        index = {"restricted": {"Sauna"}, "by_branch": {"Dao Branch": {"Sauna"}}}
+
+        self.assertTrue(is_item_available_for_branch("Sauna", "Dao Branch", index))
+        self.assertFalse(is_item_available_for_branch("Sauna", "Bohol Main", index))
+        self.assertTrue(is_item_available_for_branch("Swedish", "Bohol Main", index))
+        self.assertTrue(is_item_available_for_branch("Sauna", None, index))
+
+    def test_unmatched_tag_is_logged_not_backfilled(self):
+        items = [
+            frappe._dict(name="Sauna", description="Sauna (Available at: Dao Branch only)"),
+            frappe._dict(name="Hot Stone", description="Hot Stone (Available at: Alona Branch only)"),
+        ]
+
+        def get_all(doctype, **kwargs):
+            return {"Branch": BRANCHES, "Item Branch Availability": [], "Item": items}[doctype]
+
+        with patch("frappe.get_all", side_effect=get_all), \
+                patch("frappe.get_doc") as get_doc, \
+                patch("frappe.log_error") as log_error, \
+                patch("masaje_app.patches.backfill_item_branch_availability.clear_branch_item_index"):
+            execute()
+
+        self.assertEqual([c.args[0]["parent"] for c in get_doc.call_args_list], ["Sauna"])
+        log_error.assert_called_once()
+        self.assertIn("Hot Stone", log_error.call_args.args[0])
@@ -0,0 +1,43 @@
+import frappe
+from unittest.mock import MagicMock, patch
+from frappe.tests.utils import FrappeTestCase
+from masaje_app.branch_config import build_branch_config
+
+BRANCHES = [frappe._dict(name=b) for b in ("Bohol Main", "Dao Branch", "Panglao Branch")]
+
+PROFILES = [
+    frappe._dict(name="Bohol Main POS", warehouse="Bohol Main Store - MDB", selling_price_list="Standard Selling"),
+    frappe._dict(name="Dao Receptionist", warehouse="Dao Branch Store - MDB", selling_price_list="Dao Prices"),
+    frappe._dict(name="Old Counter", warehouse="Bohol Main Store - MDB", selling_price_list="Standard Selling"),
+]
+
+
+class TestBranchConfig(FrappeTestCase):
+    def build(self):
+        meta = MagicMock()
+        meta.has_field.return_value = False
+
+        def get_all(doctype, **kwargs):
+            return BRANCHES if doctype == "Branch" else PROFILES
+
+        with patch("frappe.get_all", side_effect=get_all), patch("frappe.get_meta", return_value=meta):
+            return build_branch_config()
+
+    def test_branch_settings(self):
+        config = self.build()
+
+        self.assertEqual(config["branches"]["Bohol Main"]["pos_profile"], "Bohol Main POS")
+        self.assertEqual(config["branches"]["Bohol Main"]["warehouse"], "Bohol Main Store - MDB")
+        # No "<branch> POS" profile - no profile name contains the branch either
+        self.assertIsNone(config["branches"]["Dao Branch"]["pos_profile"])
+        self.assertEqual(config["branches"]["Dao Branch"]["price_list"], "Dao Prices")
+        self.assertEqual(config["branches"]["Panglao Branch"]["price_list"], "Panglao Prices")
+
+    def test_reverse_lookups(self):
+        config = self.build()
+
+        self.assertEqual(config["by_pos_profile"]["Bohol Main POS"], "Bohol Main")
+        # Profiles no branch picked map back through their warehouse
+        self.assertEqual(config["by_pos_profile"]["Dao Receptionist"], "Dao Branch")
+        self.assertEqual(config["by_pos_profile"]["Old Counter"], "Bohol Main")
+        self.assertEqual(config["by_warehouse"]["Dao Branch Store - MDB"], "Dao Branch")
@@ -0,0 +1,86 @@
+import frappe
+from datetime import datetime
+from unittest.mock import patch
+from frappe.tests.utils import FrappeTestCase
+from masaje_app.bulk_booking import find_overlaps, import_service_bookings, validate_booking_batch
+from masaje_app.events import on_service_booking_update
+
+
+def at(hhmm):
+    hour, minute = hhmm.split(":")
+    return datetime(2025, 1, 6, int(hour), int(minute))
+
+
+class TestBulkValidation(FrappeTestCase):
+    def test_overlaps_within_batch_and_with_database(self):
+        intervals = [
+            ("T1", at("10:00"), at("11:00"), 1, None),
+            ("T1", at("10:30"), at("11:30"), 2, None),     # overlaps row 1
+            ("T1", at("11:30"), at("12:00"), 3, None),     # back to back - fine
+            ("T2", at("13:00"), at("14:00"), 4, None),     # overlaps SB-1
+            ("T2", at("12:00"), at("13:30"), None, "SB-1"),
+            ("T2", at("15:00"), at("16:00"), None, "SB-2"),
+            ("T2", at("15:30"), at("16:30"), None, "SB-3"),  # existing overlap - ignored
+        ]
+
+        conflicts = find_overlaps(intervals)
+
+        self.assertEqual(
+            [(c["row"], c["conflicts_with"]) for c in conflicts],
+            [(2, "row 1"), (4, "SB-1")]
+        )
+
+    def test_long_booking_blocks_later_ones(self):
+        intervals = [
+            ("T1", at("10:00"), at("13:00"), None, "SB-1"),
+            ("T1", at("10:30"), at("11:00"), None, "SB-2"),
+            ("T1", at("12:00"), at("12:30"), 1, None),
+        ]
+
+        self.assertEqual([c["conflicts_with"] for c in find_overlaps(intervals)], ["SB-1"])
+
+    def test_only_clean_bookings_are_flagged(self):
+        docs = []
+        for start, end in (("10:00", "11:00"), ("10:30", "11:30"), ("12:00", "13:00")):
+            doc = frappe._dict(name=None, therapist="T1", start_datetime=at(start), end_datetime=at(end))
+            doc.flags = frappe._dict()
+            docs.append(doc)
+
+        with patch("masaje_app.bulk_booking.get_service_durations", return_value={}), \
+                patch("masaje_app.bulk_booking.set_booking_times"), \
+                patch("masaje_app.bulk_booking.load_therapist_bookings", return_value=[]):
+            conflicts = validate_booking_batch(docs)
+
+        self.assertEqual([c["row"] for c in conflicts], [2])
+        self.assertEqual([bool(doc.flags.masaje_batch_validated) for doc in docs], [False, False, True])
+
+    def test_import_skips_per_document_side_effects(self):
+        docs = []
+        for name, status in (("SB-1", "Approved"), ("SB-2", "Pending")):
+            doc = frappe._dict(name=name, status=status, customer="C-1", invoice=None,
+                               branch="Main", booking_date="2025-01-06")
+            doc.flags = frappe._dict()
+            doc.get_doc_before_save = lambda: None
+            doc.insert = lambda doc=doc: on_service_booking_update(doc, "on_update")
+            docs.append(doc)
+
+        def validate(batch):
+            for doc in batch:
+                doc.flags.masaje_batch_validated = True
+            return []
+
+        with patch("frappe.has_permission"), \
+                patch("frappe.get_doc", side_effect=docs), \
+                patch("frappe.db"), \
+                patch("masaje_app.bulk_booking.validate_booking_batch", side_effect=validate), \
+                patch("masaje_app.bulk_booking.clear_availability_cache") as evict_batch, \
+                patch("masaje_app.bulk_booking.queue_booking_invoices") as queue_batch, \
+                patch("masaje_app.events.clear_booking_availability") as evict_doc, \
+                patch("masaje_app.events.queue_booking_invoice") as queue_doc:
+            result = import_service_bookings([{}, {}])
+
+        self.assertEqual(result["inserted"], ["SB-1", "SB-2"])
+        evict_doc.assert_not_called()
+        queue_doc.assert_not_called()
+        evict_batch.assert_called_once()
+        queue_batch.assert_called_once_with(["SB-1"])
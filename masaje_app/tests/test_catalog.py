@@ -0,0 +1,35 @@
+import frappe
+from unittest.mock import MagicMock, patch
+from frappe.tests.utils import FrappeTestCase
+from masaje_app.catalog import build_service_catalog
+
+ITEMS = [
+    frappe._dict(name="Swedish 60", item_name="Swedish 60"),
+    frappe._dict(name="Foot Spa", item_name="Foot Spa"),
+]
+
+PRICE_ROWS = [
+    frappe._dict(name="Swedish 60", item_name="Swedish 60", is_stock_item=0, standard_rate=0,
+                 list_rate=800, standard_list_rate=700),
+    # Not on the branch list
+    frappe._dict(name="Foot Spa", item_name="Foot Spa", is_stock_item=0, standard_rate=300,
+                 list_rate=None, standard_list_rate=500),
+]
+
+
+class TestServiceCatalog(FrappeTestCase):
+    def test_item_missing_from_branch_list(self):
+        db = MagicMock()
+        db.sql.side_effect = lambda query, *args, **kwargs: PRICE_ROWS if "Item Price" in query else ITEMS
+
+        with patch("frappe.db", db), \
+                patch("frappe.cache", return_value=MagicMock(hget=MagicMock(return_value=None))), \
+                patch("masaje_app.catalog.get_branch_price_list", return_value="Panglao Prices"), \
+                patch("masaje_app.catalog.get_branch_item_index", return_value={}), \
+                patch("masaje_app.catalog.is_item_available_for_branch", return_value=True), \
+                patch("masaje_app.catalog.get_service_durations", return_value={}):
+            services = {s.name: s for s in build_service_catalog("Panglao Branch")}
+
+        self.assertEqual(services["Swedish 60"].price, 800)
+        # Falls back to Standard Selling, not the Item's standard_rate
+        self.assertEqual(services["Foot Spa"].price, 500)
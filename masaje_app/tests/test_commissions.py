@@ -0,0 +1,42 @@
+import frappe
+from unittest.mock import patch
+from frappe.tests.utils import FrappeTestCase
+from masaje_app.commissions import diff_therapist_commissions, post_commission_adjustments
+
+TOTALS = {
+    "EMP-001": frappe._dict(bookings=3, revenue=4500.0, commission=450.0),
+    "EMP-002": frappe._dict(bookings=1, revenue=1500.0, commission=150.0),
+    "EMP-003": frappe._dict(bookings=2, revenue=3000.0, commission=300.0),
+}
+
+
+class TestCommissionDiff(FrappeTestCase):
+    def test_actions(self):
+        existing = {
+            "EMP-001": frappe._dict(name="COMM-1", total_bookings=3, total_revenue=4500, commission_amount=450),
+            "EMP-002": frappe._dict(name="COMM-2", total_bookings=1, total_revenue=1200, commission_amount=120),
+        }
+        diff = {d["therapist"]: d for d in diff_therapist_commissions(TOTALS, existing)}
+
+        self.assertEqual(diff["EMP-001"]["action"], "unchanged")
+        self.assertEqual(diff["EMP-002"]["action"], "update")
+        self.assertEqual(diff["EMP-002"]["name"], "COMM-2")
+        self.assertEqual(diff["EMP-002"]["current"]["commission_amount"], 120)
+        self.assertEqual(diff["EMP-002"]["new"]["commission_amount"], 150.0)
+        self.assertEqual(diff["EMP-003"]["action"], "create")
+        self.assertIsNone(diff["EMP-003"]["current"])
+
+    def test_adjustments_only_for_submitted_invoices(self):
+        invoices = [
+            {"invoice": "INV-1", "therapist": "EMP-001", "branch": "Main", "posting_date": "2025-01-06",
+             "docstatus": 1, "current": 100.0, "new": 150.0},
+            {"invoice": "INV-2", "therapist": "EMP-002", "branch": "Main", "posting_date": "2025-01-06",
+             "docstatus": 0, "current": 0.0, "new": 150.0},
+        ]
+        with patch("masaje_app.commissions.post_commission_entry") as post:
+            post_commission_adjustments(invoices)
+
+        post.assert_called_once()
+        voucher, therapist, _rate, amount = post.call_args.args
+        self.assertEqual((voucher.name, therapist, amount), ("INV-1", "EMP-001", 50.0))
+        self.assertEqual(post.call_args.kwargs, {"invoice_count": 0, "sales_amount": 0})
@@ -0,0 +1,49 @@
+import frappe
+from unittest.mock import MagicMock, patch
+from frappe.tests.utils import FrappeTestCase
+from redis.exceptions import LockNotOwnedError
+from masaje_app.holds import acquire_hold, apply_holds, count_overlapping_holds
+
+HOLDS = {
+    "tok-a": {"start": 13 * 60, "end": 14 * 60 + 30, "expires_at": 0},
+    "tok-b": {"start": 14 * 60, "end": 15 * 60, "expires_at": 0},
+}
+
+
+class TestSlotHolds(FrappeTestCase):
+    def test_overlapping_holds(self):
+        self.assertEqual(count_overlapping_holds(HOLDS, 12 * 60, 13 * 60), 0)
+        self.assertEqual(count_overlapping_holds(HOLDS, 14 * 60, 15 * 60), 2)
+        self.assertEqual(count_overlapping_holds(HOLDS, 14 * 60, 15 * 60, exclude="tok-a"), 1)
+
+    def test_holds_reduce_capacity(self):
+        slots = [{"time": t, "capacity": 2} for t in ("12:00", "13:00", "14:00", "15:00")]
+
+        with patch("masaje_app.holds.get_active_holds", return_value=HOLDS):
+            apply_holds("Main", "2025-01-06", slots, 60)
+
+        self.assertEqual([s["capacity"] for s in slots], [2, 1, 0, 2])
+
+    def test_busy_lock_is_a_validation_error(self):
+        lock = MagicMock()
+        lock.acquire.return_value = False
+
+        with patch("masaje_app.holds._holds_lock", return_value=lock):
+            self.assertRaises(frappe.ValidationError, acquire_hold, "Main", "2025-01-06", "14:00", 60)
+
+    def test_expired_lock_keeps_the_hold(self):
+        lock = MagicMock()
+        lock.acquire.return_value = True
+        lock.release.side_effect = LockNotOwnedError("expired")
+
+        with patch("masaje_app.holds._holds_lock", return_value=lock), \
+                patch("masaje_app.holds.get_slot_availability", return_value=[{"capacity": 1}]) as availability, \
+                patch("masaje_app.holds.get_active_holds", return_value={}), \
+                patch("frappe.log_error"), \
+                patch("frappe.cache") as cache:
+            hold = acquire_hold("Main", "2025-01-06", "14:00", 60)
+
+        self.assertTrue(hold["token"])
+        cache.return_value.hset.assert_called_once()
+        # Capacity is read past the cache
+        self.assertTrue(availability.call_args.kwargs["fresh"])
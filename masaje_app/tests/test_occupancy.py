@@ -0,0 +1,55 @@
+from datetime import datetime
+from frappe.tests.utils import FrappeTestCase
+from masaje_app.occupancy import TherapistDay, build_occupancy, cell_mask
+
+
+def minutes(hhmm):
+    hour, minute = hhmm.split(":")
+    return int(hour) * 60 + int(minute)
+
+
+class TestTherapistOccupancy(FrappeTestCase):
+    def setUp(self):
+        self.day = TherapistDay()
+        self.day.add(minutes("10:00"), minutes("11:00"), "SB-1")
+        self.day.add(minutes("13:00"), minutes("14:30"), "SB-2")
+
+    def test_cell_mask(self):
+        self.assertEqual(cell_mask(0, 5), 0b1)
+        self.assertEqual(cell_mask(5, 15), 0b110)
+        # Partial cells are included
+        self.assertEqual(cell_mask(7, 12), 0b110)
+
+    def test_free_busy(self):
+        self.assertTrue(self.day.is_free(minutes("09:00"), minutes("10:00")))
+        self.assertFalse(self.day.is_free(minutes("10:30"), minutes("11:30")))
+        self.assertTrue(self.day.is_free(minutes("11:00"), minutes("13:00")))
+        self.assertFalse(self.day.is_free(minutes("12:00"), minutes("16:00")))
+
+    def test_exclude_own_booking(self):
+        self.assertTrue(self.day.is_free(minutes("10:00"), minutes("11:00"), exclude="SB-1"))
+
+    def test_unaligned_neighbours_do_not_conflict(self):
+        # Walk-in ending 14:37 and the next booking starting 14:37 share a 5-minute cell
+        day = TherapistDay()
+        day.add(minutes("13:37"), minutes("14:37"), "SB-3")
+
+        self.assertTrue(day.is_free(minutes("14:37"), minutes("15:37")))
+        self.assertFalse(day.is_free(minutes("14:36"), minutes("15:36")))
+
+    def test_first_free_gap(self):
+        self.assertEqual(self.day.first_free_gap(60, after=minutes("09:00")), minutes("09:00"))
+        self.assertEqual(self.day.first_free_gap(60, after=minutes("09:30")), minutes("11:00"))
+        self.assertEqual(self.day.first_free_gap(90, after=minutes("10:00")), minutes("11:00"))
+        self.assertEqual(self.day.first_free_gap(150, after=minutes("10:00")), minutes("14:30"))
+        self.assertIsNone(self.day.first_free_gap(150, after=minutes("10:00"), before=minutes("16:00")))
+
+    def test_build_occupancy_groups_by_therapist(self):
+        occupancy = build_occupancy([
+            ("EMP-1", "SB-1", 600, 660, datetime(2025, 1, 6, 10), datetime(2025, 1, 6, 11)),
+            ("EMP-2", "SB-2", 600, 720, datetime(2025, 1, 6, 10), datetime(2025, 1, 6, 12)),
+        ])
+
+        self.assertFalse(occupancy["EMP-1"].is_free(630, 700))
+        self.assertTrue(occupancy["EMP-1"].is_free(660, 720))
+        self.assertFalse(occupancy["EMP-2"].is_free(660, 720))
@@ -80,6 +80,10 @@ def test_booking_flow():
     try:
         booking.status = "Approved"
         booking.save(ignore_permissions=True)
+
+        # Invoice creation is queued - run the job inline here
+        from masaje_app.invoicing import process_booking_invoice
+        process_booking_invoice(booking.name)
         booking.reload()
         if booking.invoice:
             results.log_pass(f"Approved booking has invoice: {booking.invoice}")
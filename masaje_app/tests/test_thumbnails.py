@@ -0,0 +1,33 @@
+import io
+from frappe.tests.utils import FrappeTestCase
+from masaje_app.thumbnails import make_webp_thumbnails, srcset_urls
+
+
+def png(width, height):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class TestThumbnails(FrappeTestCase):
+    def test_widths_and_aspect_ratio(self):
+        from PIL import Image
+
+        thumbnails = make_webp_thumbnails(png(800, 400))
+
+        self.assertEqual(sorted(thumbnails), [160, 320, 640])
+        with Image.open(io.BytesIO(thumbnails[320])) as image:
+            self.assertEqual((image.format, image.size), ("WEBP", (320, 160)))
+
+    def test_small_image_is_not_upscaled(self):
+        self.assertEqual(list(make_webp_thumbnails(png(100, 100))), [100])
+
+    def test_srcset_urls(self):
+        srcset = "/files/swedish-thumb-160wa1b2c3.webp 160w, /files/swedish-thumb-320w.webp 320w"
+        self.assertEqual(
+            srcset_urls(srcset),
+            ["/files/swedish-thumb-160wa1b2c3.webp", "/files/swedish-thumb-320w.webp"]
+        )
+        self.assertEqual(srcset_urls(None), [])
@@ -0,0 +1,139 @@
+"""
+WebP thumbnails for service images.
+
+When an Item's image changes, a background job writes resized WebP copies
+at THUMBNAIL_WIDTHS as public Files attached to the Item and stores a
+ready-made srcset on Item.image_srcset. The booking page uses the srcset so
+phones download a small thumbnail instead of the full upload.
+
+Images that are not Files on this site (e.g. external URLs) are skipped.
+"""
+import io
+import frappe
+from typing import Dict, List, Optional
+from masaje_app.catalog import clear_catalog_cache
+
+THUMBNAIL_WIDTHS = (160, 320, 640)
+WEBP_QUALITY = 80
+
+# Thumbnail files are named "<item>-thumb-<width>w.webp" (File may add a suffix)
+THUMBNAIL_MARKER = "-thumb-"
+
+
+def make_webp_thumbnails(content: bytes, widths=THUMBNAIL_WIDTHS) -> Dict[int, bytes]:
+    """
+    Resize an image to each width (keeping its aspect ratio) and encode as
+    WebP. Widths larger than the original are skipped, except that the
+    original width is used once if it is smaller than every requested width.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(content)) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+        targets = [w for w in widths if w <= image.width] or [image.width]
+
+        thumbnails = {}
+        for width in targets:
+            height = max(round(image.height * width / image.width), 1)
+            resized = image.resize((width, height), Image.LANCZOS) if width != image.width else image
+
+            buffer = io.BytesIO()
+            resized.save(buffer, "WEBP", quality=WEBP_QUALITY, method=6)
+            thumbnails[width] = buffer.getvalue()
+
+    return thumbnails
+
+
+def _get_image_content(file_url: str) -> Optional[bytes]:
+    file_name = frappe.db.get_value("File", {"file_url": file_url}, "name")
+    if not file_name:
+        return None
+    return frappe.get_doc("File", file_name).get_content()
+
+
+def srcset_urls(srcset: Optional[str]) -> List[str]:
+    """File URLs listed in a srcset ("<url> 160w, <url> 320w")."""
+    return [entry.split()[0] for entry in (srcset or "").split(",") if entry.strip()]
+
+
+def _delete_thumbnails(item_code: str, srcset: Optional[str]) -> None:
+    """
+    Delete the thumbnail Files recorded in the Item's srcset. Files are
+    matched by URL rather than by name pattern, because File may have
+    renamed them to avoid a clash.
+    """
+    urls = srcset_urls(srcset)
+    if not urls:
+        return
+
+    for file_name in frappe.get_all("File", filters={
+        "attached_to_doctype": "Item",
+        "attached_to_name": item_code,
+        "file_url": ["in", urls]
+    }, pluck="name"):
+        frappe.delete_doc("File", file_name, ignore_permissions=True)
+
+
+def generate_item_thumbnails(item_code: str) -> Optional[str]:
+    """
+    (Re)build the thumbnails of an Item from its current image and store
+    the srcset on the Item. Returns the srcset, or None if there is no
+    usable image.
+    """
+    image, old_srcset = frappe.db.get_value("Item", item_code, ["image", "image_srcset"])
+    _delete_thumbnails(item_code, old_srcset)
+
+    content = _get_image_content(image) if image else None
+    srcset = None
+
+    if content:
+        try:
+            thumbnails = make_webp_thumbnails(content)
+        except Exception:
+            frappe.log_error(f"Could not create thumbnails for {item_code}", "Masaje Thumbnails")
+            thumbnails = {}
+
+        entries = []
+        for width, data in thumbnails.items():
+            file_doc = frappe.get_doc({
+                "doctype": "File",
+                "file_name": f"{frappe.scrub(item_code)}{THUMBNAIL_MARKER}{width}w.webp",
+                "attached_to_doctype": "Item",
+                "attached_to_name": item_code,
+                "is_private": 0,
+                "content": data
+            })
+            file_doc.insert(ignore_permissions=True)
+            entries.append(f"{file_doc.file_url} {width}w")
+        srcset = ", ".join(entries) or None
+
+    # set_value skips Item hooks, so drop the cached catalogs here
+    frappe.db.set_value("Item", item_code, "image_srcset", srcset, update_modified=False)
+    clear_catalog_cache()
+
+    return srcset
+
+
+def queue_item_thumbnails(item_code: str) -> None:
+    frappe.enqueue(
+        "masaje_app.thumbnails.generate_item_thumbnails",
+        queue="short",
+        job_id=f"masaje_thumbnails_{item_code}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        item_code=item_code
+    )
+
+
+def backfill_item_thumbnails(only_missing: bool = True) -> int:
+    """Queue thumbnail jobs for items with an image. Returns the number queued."""
+    filters = {"image": ["is", "set"]}
+    if only_missing:
+        filters["image_srcset"] = ["is", "not set"]
+
+    items = frappe.get_all("Item", filters=filters, pluck="name")
+    for item_code in items:
+        queue_item_thumbnails(item_code)
+    return len(items)
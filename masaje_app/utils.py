@@ -1,6 +1,14 @@
-
 import frappe
 from frappe.utils import get_datetime, add_to_date
+from masaje_app.branch_config import STANDARD_PRICE_LIST, get_branch_config
+
+SERVICE_DURATIONS_CACHE_KEY = "masaje:service_durations"
+ITEM_PRICES_CACHE_PREFIX = "masaje:item_prices:"
+BRANCH_ITEMS_CACHE_KEY = "masaje:branch_items"
+BRANCH_NAMES_CACHE_KEY = "masaje:branches"
+
+# Duration used for items without custom_duration_minutes
+DEFAULT_SERVICE_DURATION = 60
 
 
 def get_pos_profile_for_branch(branch):
@@ -8,49 +16,182 @@ def get_pos_profile_for_branch(branch):
     Get POS Profile for a given branch.
     POS Profiles are named like '[Branch] POS' e.g., 'Dao Branch POS'.
     """
+    return get_branch_config(branch).get("pos_profile")
+
+
+def get_branch_names():
+    """Names of all branches, cached until a Branch changes."""
+    return frappe.cache().get_value(
+        BRANCH_NAMES_CACHE_KEY,
+        lambda: frappe.get_all("Branch", pluck="name", order_by="name asc", ignore_permissions=True)
+    )
+
+
+def clear_branch_names_cache():
+    frappe.cache().delete_value(BRANCH_NAMES_CACHE_KEY)
+
+
+def get_branch_price_list(branch):
+    """
+    Determine which price list to use for a given branch.
+
+    Business rules (see branch_config.py):
+    - Panglao branch uses "Panglao Prices".
+    - All other branches use "Standard Selling".
+    - If a POS Profile with a specific selling_price_list exists for a branch,
+      it can still override this default mapping.
+    """
     if not branch:
-        return None
-    
-    # First try exact match with pattern "[Branch Name] POS"
-    pos_profile_name = f"{branch} POS"
-    if frappe.db.exists("POS Profile", pos_profile_name):
-        return pos_profile_name
-    
-    # Fallback: search for profile name containing the branch
-    return frappe.db.get_value(
-        "POS Profile", 
-        {"name": ["like", f"%{branch}%"]}, 
-        "name"
+        return STANDARD_PRICE_LIST
+    return get_branch_config(branch).get("price_list") or STANDARD_PRICE_LIST
+
+
+def get_service_durations():
+    """
+    Duration index: item_code -> custom_duration_minutes for every Item
+    that has a duration set. Loaded in one query and cached until an
+    Item changes (see events.on_item_change).
+    """
+    return frappe.cache().get_value(
+        SERVICE_DURATIONS_CACHE_KEY,
+        lambda: dict(frappe.get_all(
+            "Item",
+            filters={"custom_duration_minutes": [">", 0]},
+            fields=["name", "custom_duration_minutes"],
+            as_list=True,
+            ignore_permissions=True
+        ))
     )
 
 
-def create_pos_invoice_for_booking(booking_doc, save=True):
+def get_service_duration(item_code, durations=None):
+    """
+    Duration in minutes of a service item, defaulting to 60.
+    Pass `durations` when resolving many items to reuse one index lookup.
+    """
+    if durations is None:
+        durations = get_service_durations()
+    return durations.get(item_code) or DEFAULT_SERVICE_DURATION
+
+
+def clear_service_duration_cache():
+    frappe.cache().delete_value(SERVICE_DURATIONS_CACHE_KEY)
+
+
+def get_branch_item_index():
+    """
+    Branch availability index built from Item.available_branches:
+    {"restricted": items limited to some branches,
+     "by_branch": branch -> items offered there}.
+    Items without rows are offered everywhere and do not appear at all.
+    Cached until an Item changes (see events.on_item_change).
+    """
+    def build():
+        rows = frappe.get_all(
+            "Item Branch Availability",
+            filters={"parenttype": "Item", "parentfield": "available_branches"},
+            fields=["parent", "branch"],
+            as_list=True,
+            ignore_permissions=True
+        )
+        by_branch = {}
+        for item_code, branch in rows:
+            by_branch.setdefault(branch, set()).add(item_code)
+        return {"restricted": {item_code for item_code, _ in rows}, "by_branch": by_branch}
+
+    return frappe.cache().get_value(BRANCH_ITEMS_CACHE_KEY, build)
+
+
+def is_item_available_for_branch(item_code, branch, index=None):
+    """Whether a service is offered at a branch. With no branch every item is."""
+    if not branch:
+        return True
+    if index is None:
+        index = get_branch_item_index()
+    return item_code not in index["restricted"] or item_code in index["by_branch"].get(branch, ())
+
+
+def clear_branch_item_index():
+    frappe.cache().delete_value(BRANCH_ITEMS_CACHE_KEY)
+
+
+class InvoiceContext:
+    """
+    Lookups shared by the POS Invoices of a batch of bookings: POS Profile
+    docs and Sales Persons per therapist. Each is read from the database
+    once per batch instead of once per invoice. Branch settings come from
+    the cached branch registry.
+    """
+
+    def __init__(self):
+        self.profile_docs = {}
+        self.sales_persons = {}
+
+    def get_pos_profile(self, branch):
+        return get_pos_profile_for_branch(branch)
+
+    def get_profile_doc(self, pos_profile):
+        if pos_profile not in self.profile_docs:
+            self.profile_docs[pos_profile] = frappe.get_doc("POS Profile", pos_profile)
+        return self.profile_docs[pos_profile]
+
+    def get_cost_center(self, branch):
+        return get_branch_config(branch).get("cost_center")
+
+    def load_sales_persons(self, therapists):
+        """Look up the Sales Persons of many therapists in one query."""
+        missing = [t for t in set(therapists) if t and t not in self.sales_persons]
+        if not missing:
+            return
+
+        found = {}
+        for name, employee in frappe.get_all(
+            "Sales Person",
+            filters={"employee": ["in", missing], "enabled": 1},
+            fields=["name", "employee"],
+            as_list=True
+        ):
+            found.setdefault(employee, name)
+
+        for therapist in missing:
+            self.sales_persons[therapist] = found.get(therapist)
+
+    def get_sales_person(self, therapist):
+        self.load_sales_persons([therapist])
+        return self.sales_persons.get(therapist)
+
+
+def create_pos_invoice_for_booking(booking_doc, save=True, context=None, raise_exception=False):
     """
     Create a draft POS Invoice for a Service Booking.
     
     Args:
         booking_doc: Service Booking document
         save: Whether to save the invoice (default True)
+        context: InvoiceContext to share lookups across a batch (optional)
+        raise_exception: Raise errors instead of logging them and returning None
         
     Returns:
         POS Invoice name if successful, None otherwise
     """
-    if not booking_doc.branch:
-        frappe.log_error("Cannot create POS Invoice: No branch specified", "Masaje Booking")
+    def fail(message):
+        if raise_exception:
+            frappe.throw(message, frappe.ValidationError)
+        frappe.log_error(message, "Masaje Booking")
         return None
-        
-    pos_profile_name = get_pos_profile_for_branch(booking_doc.branch)
+
+    if not booking_doc.branch:
+        return fail("Cannot create POS Invoice: No branch specified")
+
+    context = context or InvoiceContext()
+    pos_profile_name = context.get_pos_profile(booking_doc.branch)
     
     if not pos_profile_name:
-        frappe.log_error(
-            f"POS Profile not found for branch: {booking_doc.branch}", 
-            "Masaje Booking"
-        )
-        return None
+        return fail(f"POS Profile not found for branch: {booking_doc.branch}")
     
     try:
-        profile_doc = frappe.get_doc("POS Profile", pos_profile_name)
-        cost_center = frappe.db.get_value("Branch", booking_doc.branch, "default_cost_center")
+        profile_doc = context.get_profile_doc(pos_profile_name)
+        cost_center = context.get_cost_center(booking_doc.branch)
         warehouse = profile_doc.warehouse
         
         # Create Invoice
@@ -75,21 +216,23 @@ def create_pos_invoice_for_booking(booking_doc, save=True):
         booking_items = []
         
         if booking_doc.get("items") and len(booking_doc.items) > 0:
-            for item in booking_doc.items:
-                booking_items.append({
-                    "service_item": item.service_item,
-                    "price": item.price or get_item_price(item.service_item, profile_doc.selling_price_list)
-                })
+            booking_items = [
+                {"service_item": item.service_item, "price": item.price}
+                for item in booking_doc.items
+            ]
         elif booking_doc.service_item:
-            price = get_item_price(booking_doc.service_item, profile_doc.selling_price_list)
-            booking_items.append({
-                "service_item": booking_doc.service_item,
-                "price": price
-            })
+            booking_items = [{"service_item": booking_doc.service_item, "price": None}]
+
+        # Prices and stock flags for every item in one lookup
+        item_prices = get_item_prices(
+            [item["service_item"] for item in booking_items], profile_doc.selling_price_list
+        )
+        for item in booking_items:
+            if not item["price"]:
+                item["price"] = item_prices.get(item["service_item"], {}).get("price") or 0
         
         if not booking_items:
-            frappe.log_error("Cannot create POS Invoice: No items found", "Masaje Booking")
-            return None
+            return fail("Cannot create POS Invoice: No items found")
         
         # Add items to invoice
         total_comm = 0.0
@@ -98,7 +241,7 @@ def create_pos_invoice_for_booking(booking_doc, save=True):
             total_comm += item_comm
             
             # Check if item is a stock item - only add warehouse for stock items
-            is_stock_item = frappe.db.get_value("Item", item["service_item"], "is_stock_item")
+            is_stock_item = item_prices.get(item["service_item"], {}).get("is_stock_item")
             
             item_row = {
                 "item_code": item["service_item"],
@@ -118,10 +261,7 @@ def create_pos_invoice_for_booking(booking_doc, save=True):
         
         # Sales Team Logic
         if booking_doc.therapist:
-            sales_person = frappe.db.get_value(
-                "Sales Person", 
-                {"employee": booking_doc.therapist, "enabled": 1}
-            )
+            sales_person = context.get_sales_person(booking_doc.therapist)
             if sales_person:
                 pos_inv.append("sales_team", {
                     "sales_person": sales_person,
@@ -145,35 +285,80 @@ def create_pos_invoice_for_booking(booking_doc, save=True):
             return pos_inv
             
     except Exception as e:
+        if raise_exception:
+            raise
         frappe.log_error(f"POS Invoice creation failed: {str(e)}", "Masaje Booking")
         return None
 
 
+def get_item_prices(item_codes, price_list=None):
+    """
+    Price matrix for a set of items: item_code -> {item_name, price, is_stock_item}.
+
+    The price is the rate on `price_list`, else on Standard Selling, else the
+    Item's standard_rate. Items are cached per (price_list, item) in a Redis
+    hash, and the ones not cached yet are resolved together in one query.
+    Unknown item codes are left out.
+    """
+    price_list = price_list or STANDARD_PRICE_LIST
+    key = f"{ITEM_PRICES_CACHE_PREFIX}{price_list}"
+    cache = frappe.cache()
+
+    item_codes = list(dict.fromkeys(item_codes))
+    if not item_codes:
+        return {}
+
+    prices = {}
+    missing = []
+    for item_code in item_codes:
+        cached = cache.hget(key, item_code)
+        if cached is None:
+            missing.append(item_code)
+        else:
+            prices[item_code] = cached
+
+    if missing:
+        rows = frappe.db.sql("""
+            SELECT item.name, item.item_name, item.is_stock_item, item.standard_rate,
+                list_price.price_list_rate AS list_rate,
+                standard_price.price_list_rate AS standard_list_rate
+            FROM `tabItem` item
+            LEFT JOIN `tabItem Price` list_price
+                ON list_price.item_code = item.name AND list_price.price_list = %(price_list)s
+            LEFT JOIN `tabItem Price` standard_price
+                ON standard_price.item_code = item.name AND standard_price.price_list = %(standard)s
+            WHERE item.name IN %(items)s
+        """, {
+            "price_list": price_list,
+            "standard": STANDARD_PRICE_LIST,
+            "items": missing
+        }, as_dict=True)
+
+        for row in rows:
+            # Several Item Price rows (e.g. per UOM) - keep the first, like get_value
+            if row.name in prices:
+                continue
+            prices[row.name] = {
+                "item_name": row.item_name,
+                "price": row.list_rate or row.standard_list_rate or row.standard_rate or 0,
+                "is_stock_item": row.is_stock_item
+            }
+            cache.hset(key, row.name, prices[row.name])
+
+    return prices
+
+
 def get_item_price(item_code, price_list=None):
     """
     Get price for an item from a price list.
-    Falls back to standard_rate if no price list price found.
+    Falls back to Standard Selling, then to the Item's standard_rate.
     """
-    price = None
-    
-    if price_list:
-        price = frappe.db.get_value(
-            "Item Price", 
-            {"item_code": item_code, "price_list": price_list}, 
-            "price_list_rate"
-        )
-    
-    if not price:
-        price = frappe.db.get_value(
-            "Item Price", 
-            {"item_code": item_code, "price_list": "Standard Selling"}, 
-            "price_list_rate"
-        )
-    
-    if not price:
-        price = frappe.db.get_value("Item", item_code, "standard_rate") or 0
-    
-    return price
+    item = get_item_prices([item_code], price_list).get(item_code)
+    return item["price"] if item else 0
+
+
+def clear_item_price_cache():
+    frappe.cache().delete_keys(ITEM_PRICES_CACHE_PREFIX)
 
 
 def calculate_booking_commission(booking_doc, rate=0.10):